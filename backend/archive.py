@@ -0,0 +1,328 @@
+import asyncio
+import datetime
+import glob
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import closing
+
+from sqlalchemy import case, delete, func, select, tuple_
+
+from database import ArchivedBatch, ParkingSession, engine, session_scope
+
+COLUMNS = ("id", "plate", "entry_time", "exit_time", "is_paid", "amount_due", "image_path", "zone", "updated_at")
+DATETIME_COLUMNS = ("entry_time", "exit_time", "updated_at")
+# Same text format as SQLAlchemy's SQLite DateTime, so values compare the same way in both stores
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+PARTITION_RE = re.compile(r"sessions_(\d{4})_(\d{2})\.db$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parking_sessions (
+    id INTEGER PRIMARY KEY, plate TEXT, entry_time TEXT, exit_time TEXT, is_paid INTEGER,
+    amount_due REAL, image_path TEXT, zone TEXT, updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_parking_sessions_entry_id ON parking_sessions (entry_time, id);
+CREATE INDEX IF NOT EXISTS ix_parking_sessions_plate_entry ON parking_sessions (plate, entry_time);
+"""
+INSERT = (f"INSERT OR REPLACE INTO parking_sessions ({', '.join(COLUMNS)}) "
+          f"VALUES ({', '.join('?' for _ in COLUMNS)})")
+
+
+def _to_db(value):
+    return value.strftime(DATETIME_FORMAT) if isinstance(value, datetime.datetime) else value
+
+
+def _from_db(row):
+    record = dict(zip(COLUMNS, row))
+    for column in DATETIME_COLUMNS:
+        if record[column] is not None:
+            record[column] = datetime.datetime.fromisoformat(record[column])
+    record["is_paid"] = bool(record["is_paid"])
+    return record
+
+
+def month_bounds(month):
+    """[start, end) of a "YYYY-MM" partition."""
+    start = datetime.datetime.strptime(month, "%Y-%m")
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def escape_like(prefix):
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class SessionArchive:
+    """Closed sessions in monthly SQLite partitions (sessions_YYYY_MM.db by entry month); blocking."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, month):
+        return os.path.join(self.directory, f"sessions_{month.replace('-', '_')}.db")
+
+    def _connect(self, month):
+        return closing(sqlite3.connect(self._path(month)))
+
+    def partitions(self):
+        """Archived months ("YYYY-MM"), oldest first."""
+        months = []
+        for path in glob.glob(os.path.join(self.directory, "sessions_*.db")):
+            match = PARTITION_RE.search(path)
+            if match:
+                months.append(f"{match[1]}-{match[2]}")
+        return sorted(months)
+
+    def size_bytes(self, month):
+        return os.path.getsize(self._path(month))
+
+    def write(self, rows):
+        """Store session rows (dicts of COLUMNS) in the partitions of their entry months; committed on return."""
+        by_month = defaultdict(list)
+        for row in rows:
+            by_month[row["entry_time"].strftime("%Y-%m")].append(tuple(_to_db(row[c]) for c in COLUMNS))
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            for month, values in by_month.items():
+                with self._connect(month) as conn:
+                    conn.executescript(SCHEMA)
+                    with conn:
+                        conn.executemany(INSERT, values)
+        return {month: [value[0] for value in values] for month, values in by_month.items()}
+
+    def _filters(self, plate_prefix=None, zone=None, from_time=None, to_time=None, unpaid=False):
+        where, params = [], []
+        if unpaid:
+            where.append("NOT is_paid")
+        if plate_prefix:
+            where.append("plate LIKE ? ESCAPE '\\'")
+            params.append(f"{escape_like(plate_prefix)}%")
+        if zone:
+            where.append("zone = ?")
+            params.append(zone)
+        if from_time:
+            where.append("entry_time >= ?")
+            params.append(_to_db(from_time))
+        if to_time:
+            where.append("entry_time < ?")
+            params.append(_to_db(to_time))
+        return where, params
+
+    def query(self, month, plate_prefix=None, zone=None, from_time=None, to_time=None, before=None, limit=100,
+              unpaid=False):
+        """Sessions of one partition, newest entry first; `before` is an (entry_time, id) cursor."""
+        where, params = self._filters(plate_prefix, zone, from_time, to_time, unpaid)
+        if before:
+            where.append("(entry_time, id) < (?, ?)")
+            params += [_to_db(before[0]), before[1]]
+        sql = (f"SELECT {', '.join(COLUMNS)} FROM parking_sessions"
+               f"{' WHERE ' + ' AND '.join(where) if where else ''} ORDER BY entry_time DESC, id DESC LIMIT ?")
+        with self._connect(month) as conn:
+            return [_from_db(row) for row in conn.execute(sql, params + [limit])]
+
+    def ids(self, month, first_id, last_id):
+        """Ids of one partition between `first_id` and `last_id` (inclusive)."""
+        with self._connect(month) as conn:
+            return {row[0] for row in conn.execute(
+                "SELECT id FROM parking_sessions WHERE id BETWEEN ? AND ?", (first_id, last_id))}
+
+    def summary(self, month, zone=None, from_time=None, to_time=None):
+        """{zone: totals} of one partition (sessions, paid, revenue, minutes parked)."""
+        where, params = self._filters(zone=zone, from_time=from_time, to_time=to_time)
+        sql = ("SELECT zone, count(*), coalesce(sum(is_paid), 0), "
+               "coalesce(sum(CASE WHEN is_paid THEN amount_due ELSE 0 END), 0), "
+               "coalesce(sum((julianday(exit_time) - julianday(entry_time)) * 1440), 0) FROM parking_sessions"
+               f"{' WHERE ' + ' AND '.join(where) if where else ''} GROUP BY zone")
+        with self._connect(month) as conn:
+            return {zone: {"sessions": n, "paid": paid, "revenue": revenue, "minutes": minutes}
+                    for zone, n, paid, revenue, minutes in conn.execute(sql, params)}
+
+
+class Archiver:
+    """Moves sessions closed more than `after_days` ago from parking_sessions into a SessionArchive, in batches."""
+
+    def __init__(self, archive, writer, after_days=90, batch_size=2000):
+        self.archive = archive
+        self.writer = writer
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self._lock = asyncio.Lock()
+        self.last_run = None
+
+    async def run(self, now=None, max_batches=None):
+        """Archive everything past the cutoff (or `max_batches` batches). Returns what was moved."""
+        async with self._lock:
+            cutoff = (now or datetime.datetime.now()) - datetime.timedelta(days=self.after_days)
+            start = time.perf_counter()
+            moved, batches, partitions = 0, 0, defaultdict(int)
+            while max_batches is None or batches < max_batches:
+                async with session_scope() as db:
+                    rows = (await db.execute(
+                        select(*(getattr(ParkingSession, column) for column in COLUMNS))
+                        .where(ParkingSession.exit_time < cutoff)
+                        .order_by(ParkingSession.exit_time).limit(self.batch_size)
+                    )).mappings().all()
+                if not rows:
+                    break
+                written = await asyncio.to_thread(self.archive.write, [dict(row) for row in rows])
+                await self.writer.submit(self._delete_op(written))
+                moved += len(rows)
+                batches += 1
+                for month, ids in written.items():
+                    partitions[month] += len(ids)
+
+            self.last_run = {
+                "cutoff": cutoff,
+                "moved": moved,
+                "batches": batches,
+                "partitions": dict(sorted(partitions.items())),
+                "elapsed_s": round(time.perf_counter() - start, 3),
+                "finished_at": datetime.datetime.now(),
+            }
+            if moved:
+                print(f"Archived {moved} sessions closed before {cutoff:%Y-%m-%d} in {self.last_run['elapsed_s']} s")
+            return self.last_run
+
+    @staticmethod
+    def _delete_op(written):
+        async def op(db):
+            for month, ids in written.items():
+                await db.execute(
+                    delete(ParkingSession).where(ParkingSession.id.in_(ids), ParkingSession.exit_time != None)
+                    .execution_options(synchronize_session=False)
+                )
+                db.add(ArchivedBatch(partition=month, rows=len(ids), first_id=min(ids), last_id=max(ids)))
+        return op
+
+    async def stats(self):
+        async with session_scope() as db:
+            counts = dict((await db.execute(
+                select(ArchivedBatch.partition, func.sum(ArchivedBatch.rows)).group_by(ArchivedBatch.partition)
+            )).all())
+        return {
+            "after_days": self.after_days,
+            "batch_size": self.batch_size,
+            "directory": self.archive.directory,
+            "partitions": [
+                {"month": month, "rows": counts.get(month, 0),
+                 "size_mb": round(self.archive.size_bytes(month) / 1024 / 1024, 2)}
+                for month in self.archive.partitions()
+            ],
+            "last_run": self.last_run,
+        }
+
+
+def _hot_filters(query, plate_prefix=None, zone=None, from_time=None, to_time=None, unpaid=False):
+    if unpaid:
+        query = query.where(ParkingSession.is_paid == False)
+    if plate_prefix:
+        query = query.where(ParkingSession.plate.like(f"{escape_like(plate_prefix)}%", escape="\\"))
+    if zone:
+        query = query.where(ParkingSession.zone == zone)
+    if from_time:
+        query = query.where(ParkingSession.entry_time >= from_time)
+    if to_time:
+        query = query.where(ParkingSession.entry_time < to_time)
+    return query
+
+
+async def query_history(archive, plate_prefix=None, zone=None, from_time=None, to_time=None, before=None, limit=100,
+                        unpaid=False):
+    """Sessions from the hot table and the archive, newest entry first. Returns (rows, more)."""
+    query = _hot_filters(select(*(getattr(ParkingSession, column) for column in COLUMNS)),
+                         plate_prefix, zone, from_time, to_time, unpaid)
+    if before:
+        query = query.where(tuple_(ParkingSession.entry_time, ParkingSession.id) < before)
+    query = query.order_by(ParkingSession.entry_time.desc(), ParkingSession.id.desc()).limit(limit + 1)
+    async with session_scope() as db:
+        found = {row["id"]: dict(row) for row in (await db.execute(query)).mappings()}
+
+    key = lambda row: (row["entry_time"], row["id"])
+    rows = sorted(found.values(), key=key, reverse=True)
+    for month in reversed(archive.partitions()):
+        start, end = month_bounds(month)
+        if (from_time and end <= from_time) or (to_time and start >= to_time) or (before and start > before[0]):
+            continue
+        if len(rows) > limit and rows[limit]["entry_time"] >= end:
+            break
+        part = await asyncio.to_thread(archive.query, month, plate_prefix, zone, from_time, to_time, before, limit + 1,
+                                       unpaid)
+        # A row archived but not yet deleted from the hot table is in both - keep it once
+        found.update((row["id"], row) for row in part)
+        rows = sorted(found.values(), key=key, reverse=True)[:limit + 1]
+        found = {row["id"]: row for row in rows}
+    return rows[:limit], len(rows) > limit
+
+
+def _entry_month():
+    # SQLite by default, PostgreSQL through DATABASE_URL
+    if engine.dialect.name == "sqlite":
+        return func.strftime("%Y-%m", ParkingSession.entry_time)
+    return func.to_char(ParkingSession.entry_time, "YYYY-MM")
+
+
+def _minutes_parked():
+    if engine.dialect.name == "sqlite":
+        return (func.julianday(ParkingSession.exit_time) - func.julianday(ParkingSession.entry_time)) * 1440
+    return func.extract("epoch", ParkingSession.exit_time - ParkingSession.entry_time) / 60
+
+
+def _hot_summary(zone=None, from_time=None, to_time=None):
+    """(month, zone, sessions, paid, revenue, minutes, first id, last id) of closed sessions in the hot table."""
+    month = _entry_month().label("month")
+    return _hot_filters(
+        select(
+            month, ParkingSession.zone, func.count(),
+            func.coalesce(func.sum(case((ParkingSession.is_paid == True, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((ParkingSession.is_paid == True, ParkingSession.amount_due), else_=0.0)), 0.0),
+            func.coalesce(func.sum(_minutes_parked()), 0.0),
+            func.min(ParkingSession.id), func.max(ParkingSession.id),
+        ).where(ParkingSession.exit_time != None).group_by(month, ParkingSession.zone),
+        zone=zone, from_time=from_time, to_time=to_time,
+    )
+
+
+async def summarize_history(archive, zone=None, from_time=None, to_time=None, chunk=5000):
+    """Per month and zone totals of closed sessions (count, paid, revenue, average stay) over hot and archived data."""
+    totals = defaultdict(lambda: {"sessions": 0, "paid": 0, "revenue": 0.0, "minutes": 0.0})
+    names = ("sessions", "paid", "revenue", "minutes")
+    partitions = archive.partitions()
+    async with session_scope() as db:
+        ranges = {}
+        for month, row_zone, *values, first_id, last_id in await db.execute(_hot_summary(zone, from_time, to_time)):
+            bucket = totals[(month, row_zone)]
+            for name, value in zip(names, values):
+                bucket[name] += value or 0
+            lo, hi = ranges.get(month, (first_id, last_id))
+            ranges[month] = (min(lo, first_id), max(hi, last_id))
+
+        # A row archived but not yet deleted from the hot table is in both - counted from the archive only
+        archived = set()
+        for month in ranges.keys() & set(partitions):
+            archived |= await asyncio.to_thread(archive.ids, month, *ranges[month])
+        archived = sorted(archived)
+        for i in range(0, len(archived), chunk):
+            query = _hot_summary(zone, from_time, to_time).where(ParkingSession.id.in_(archived[i:i + chunk]))
+            for month, row_zone, *values, _, _ in await db.execute(query):
+                bucket = totals[(month, row_zone)]
+                for name, value in zip(names, values):
+                    bucket[name] -= value or 0
+
+    for month in partitions:
+        start, end = month_bounds(month)
+        if (from_time and end <= from_time) or (to_time and start >= to_time):
+            continue
+        for row_zone, part in (await asyncio.to_thread(archive.summary, month, zone, from_time, to_time)).items():
+            bucket = totals[(month, row_zone)]
+            for name, value in part.items():
+                bucket[name] += value
+
+    return [
+        {"month": month, "zone": row_zone, "sessions": t["sessions"], "paid": t["paid"],
+         "revenue": round(t["revenue"], 2), "avg_minutes": round(t["minutes"] / t["sessions"], 1)}
+        for (month, row_zone), t in sorted(totals.items()) if t["sessions"]
+    ]
@@ -0,0 +1,116 @@
+import json
+import os
+import tarfile
+import threading
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+MANIFEST_NAME = "metadata.json"
+MODES = ("entry", "exit")
+
+
+@dataclass
+class BatchFrame:
+    """One frame of a /process_batch upload. `read()` returns the encoded image (blocking, call off the loop)."""
+    index: int  # position in the upload
+    name: str
+    camera_id: str
+    mode: str
+    captured_at: Optional[datetime]
+    read: Callable[[], bytes]
+
+
+def parse_captured_at(value):
+    """Capture time from ISO 8601 or Unix seconds, as naive local time like the session times in the DB."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid captured_at: {value!r}")
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def parse_metadata(text):
+    """The `metadata` form field: a JSON list (per frame, in upload order) or an object keyed by file name."""
+    if not text:
+        return None
+    try:
+        metadata = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid metadata JSON: {e}")
+    if not isinstance(metadata, (list, dict)):
+        raise ValueError("Metadata must be a list or an object keyed by file name")
+    return metadata
+
+
+def _make_frame(index, name, read, metadata, defaults):
+    if isinstance(metadata, list):
+        entry = metadata[index] if index < len(metadata) else {}
+    elif isinstance(metadata, dict):
+        entry = metadata.get(name) or metadata.get(os.path.basename(name)) or {}
+    else:
+        entry = {}
+    if not isinstance(entry, dict):
+        raise ValueError(f"Metadata of {name} must be an object")
+    mode = entry.get("mode", defaults["mode"])
+    if mode not in MODES:
+        raise ValueError(f"Invalid mode of {name}: {mode!r}")
+    camera_id = str(entry.get("camera_id") or entry.get("gate") or defaults["camera_id"])
+    return BatchFrame(index, name, camera_id, mode, parse_captured_at(entry.get("captured_at")), read)
+
+
+def frames_from_uploads(files, metadata, defaults):
+    """Frames of a multipart list of files, read lazily while the response streams."""
+    if isinstance(metadata, list) and len(metadata) != len(files):
+        raise ValueError(f"Metadata has {len(metadata)} entries for {len(files)} files")
+    return [
+        _make_frame(index, upload.filename or str(index), upload.file.read, metadata, defaults)
+        for index, upload in enumerate(files)
+    ]
+
+
+def frames_from_archive(fileobj, metadata, defaults):
+    """Frames of a zip or tar archive, image members in archive order; metadata.json used if no `metadata`."""
+    lock = threading.Lock()
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        archive = zipfile.ZipFile(fileobj)
+        names = [info.filename for info in archive.infolist() if not info.is_dir()]
+
+        def reader(name):
+            def read():
+                with lock:
+                    return archive.read(name)
+            return read
+    else:
+        fileobj.seek(0)
+        try:
+            archive = tarfile.open(fileobj=fileobj, mode="r:*")
+        except tarfile.TarError:
+            raise ValueError("Archive must be a zip or tar file")
+        members = {member.name: member for member in archive.getmembers() if member.isfile()}
+        names = list(members)
+
+        def reader(name):
+            def read():
+                with lock:
+                    return archive.extractfile(members[name]).read()
+            return read
+
+    if metadata is None and MANIFEST_NAME in names:
+        metadata = parse_metadata(reader(MANIFEST_NAME)().decode())
+    images = [name for name in names if name.lower().endswith(IMAGE_EXTENSIONS)]
+    if isinstance(metadata, list) and len(metadata) != len(images):
+        raise ValueError(f"Metadata has {len(metadata)} entries for {len(images)} images")
+    return [_make_frame(index, name, reader(name), metadata, defaults) for index, name in enumerate(images)]
+
+
+def order_by_capture(frames):
+    """Capture-time order; frames without a capture time go last, in upload order (they are stamped on arrival)."""
+    return sorted(frames, key=lambda f: (f.captured_at is None, f.captured_at or datetime.min, f.index))
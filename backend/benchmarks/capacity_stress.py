@@ -0,0 +1,214 @@
+"""Concurrency stress test of the zone capacity engine: the lot must never go over capacity.
+
+Run from the backend directory:
+    python -m benchmarks.capacity_stress [--zones A:5,B:10,C:3] [--workers 300] [--cycles 20] [--mode group]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zones", default="A:5,B:10,C:3")
+    parser.add_argument("--gates-per-zone", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=300, help="concurrent coroutine clients")
+    parser.add_argument("--threads", type=int, default=8, help="clients calling from OS threads")
+    parser.add_argument("--cycles", type=int, default=20, help="entry attempts per client")
+    parser.add_argument("--mode", default="group", help="DB commit mode: sync / group / async")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+class Checker:
+    """Records the highest occupancy seen per zone and every observation above capacity."""
+
+    def __init__(self, capacity):
+        self.capacity = dict(capacity)
+        self.max_seen = {name: 0 for name in capacity}
+        self.violations = []
+
+    def observe(self, source, occupancy):
+        for zone, occupied in occupancy.items():
+            self.max_seen[zone] = max(self.max_seen[zone], occupied)
+            if occupied > self.capacity[zone]:
+                self.violations.append((source, zone, occupied))
+
+
+async def client(parking, checker, rng, name, args, counts):
+    gates = list(parking.zones.gates)
+    for cycle in range(args.cycles):
+        plate = f"{name}{cycle:04d}"
+        ok, _ = await parking.process_entry(plate, gate=rng.choice(gates))
+        checker.observe("engine", {z: s.occupied for z, s in parking.zones.zones.items()})
+        counts["admitted" if ok else "rejected"] += 1
+        if not ok:
+            await asyncio.sleep(rng.random() * 0.002)
+            continue
+        await asyncio.sleep(rng.random() * 0.005)  # dwell time
+        await parking.pay(plate)
+        ok, _ = await parking.process_exit(plate)
+        checker.observe("engine", {z: s.occupied for z, s in parking.zones.zones.items()})
+        counts["exited"] += ok
+
+
+def thread_client(parking, loop, seed, name, args, results):
+    rng = random.Random(seed)
+    counts = results[name] = {"admitted": 0, "rejected": 0, "exited": 0}
+    run = lambda coro: asyncio.run_coroutine_threadsafe(coro, loop).result()
+    gates = list(parking.zones.gates)
+    for cycle in range(args.cycles):
+        plate = f"{name}{cycle:04d}"
+        ok, _ = run(parking.process_entry(plate, gate=rng.choice(gates)))
+        counts["admitted" if ok else "rejected"] += 1
+        if ok:
+            run(parking.pay(plate))
+            ok, _ = run(parking.process_exit(plate))
+            counts["exited"] += ok
+
+
+async def db_monitor(checker, stop):
+    from sqlalchemy import func, select
+    from database import ParkingSession, ParkingZone, session_scope
+
+    polls = 0
+    while not stop.is_set():
+        async with session_scope() as db:
+            active = dict((await db.execute(
+                select(ParkingSession.zone, func.count()).where(ParkingSession.exit_time == None)
+                .group_by(ParkingSession.zone)
+            )).all())
+            stored = dict((await db.execute(select(ParkingZone.name, ParkingZone.occupied))).all())
+        checker.observe("db sessions", active)
+        checker.observe("db zones", stored)
+        polls += 1
+        await asyncio.sleep(0.01)
+    return polls
+
+
+async def run_engine(args, zones, gates):
+    from sqlalchemy import func, select
+    from database import ParkingSession, ParkingZone, make_writer, session_scope
+    from logic import ParkingSystem
+    from zones import CapacityEngine
+
+    parking = ParkingSystem(writer=make_writer(args.mode), zones=CapacityEngine(zones, gates))
+    await parking.start()
+    checker = Checker(zones)
+    counts = {"admitted": 0, "rejected": 0, "exited": 0}
+    loop = asyncio.get_running_loop()
+
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(db_monitor(checker, stop))
+    start = time.perf_counter()
+    thread_counts = {}
+    threads = [threading.Thread(target=thread_client,
+                                args=(parking, loop, args.seed + i, f"T{i:03d}", args, thread_counts))
+               for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    rng = random.Random(args.seed)
+    await asyncio.gather(*(client(parking, checker, random.Random(rng.random()), f"C{i:04d}", args, counts)
+                           for i in range(args.workers)))
+    await asyncio.gather(*(asyncio.to_thread(thread.join) for thread in threads))
+    for per_thread in thread_counts.values():
+        for key, value in per_thread.items():
+            counts[key] += value
+    elapsed = time.perf_counter() - start
+    stop.set()
+    polls = await monitor
+    await parking.close()
+
+    # Final agreement: engine == cache == DB sessions == DB zone rows
+    async with session_scope() as db:
+        active = dict((await db.execute(
+            select(ParkingSession.zone, func.count()).where(ParkingSession.exit_time == None)
+            .group_by(ParkingSession.zone)
+        )).all())
+        stored = dict((await db.execute(select(ParkingZone.name, ParkingZone.occupied))).all())
+    engine = {z: s.occupied for z, s in parking.zones.zones.items()}
+    cache = {z: sum(1 for r in parking.active.values() if r.zone == z) for z in zones}
+    consistent = all(engine[z] == cache[z] == active.get(z, 0) == stored.get(z, 0) for z in zones)
+    calls = counts["admitted"] * 3 + counts["rejected"]
+    return {
+        "counts": counts, "elapsed": elapsed, "calls_per_s": calls / elapsed, "polls": polls,
+        "max_seen": checker.max_seen, "capacity": checker.capacity, "violations": checker.violations,
+        "consistent": consistent, "final": {"engine": engine, "cache": cache, "db": active, "db_zones": stored},
+    }
+
+
+class NaiveCounter:
+    """Control: check, await (a DB round trip), then increment - the race the engine avoids."""
+
+    def __init__(self, zones):
+        self.capacity = dict(zones)
+        self.occupied = {zone: 0 for zone in zones}
+
+    async def enter(self, zone):
+        if self.occupied[zone] >= self.capacity[zone]:
+            return False
+        await asyncio.sleep(0)
+        self.occupied[zone] += 1
+        return True
+
+    async def leave(self, zone):
+        await asyncio.sleep(0)
+        self.occupied[zone] -= 1
+
+
+async def run_naive(args, zones):
+    counter = NaiveCounter(zones)
+    checker = Checker(zones)
+
+    async def naive_client(rng):
+        for _ in range(args.cycles):
+            zone = rng.choice(list(zones))
+            if await counter.enter(zone):
+                checker.observe("naive", counter.occupied)
+                await asyncio.sleep(rng.random() * 0.005)
+                await counter.leave(zone)
+
+    rng = random.Random(args.seed)
+    await asyncio.gather(*(naive_client(random.Random(rng.random())) for _ in range(args.workers)))
+    return checker
+
+
+async def main():
+    args = parse_args()
+    os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "stress.db")
+    from database import init_db
+    await init_db()
+
+    zones = {name: int(capacity) for name, capacity in
+             (item.split(":") for item in args.zones.split(","))}
+    gates = {f"gate-{zone}{i}": zone for zone in zones for i in range(1, args.gates_per_zone + 1)}
+    clients = args.workers + args.threads
+    print(f"zones {zones} ({sum(zones.values())} spots), {len(gates)} gates, {clients} clients "
+          f"({args.threads} threads) x {args.cycles} cycles, commit mode {args.mode}")
+
+    r = await run_engine(args, zones, gates)
+    c = r["counts"]
+    print(f"{r['elapsed']:.2f} s, {r['calls_per_s']:.0f} calls/s: {c['admitted']} admitted, "
+          f"{c['rejected']} rejected (full), {c['exited']} exited, {r['polls']} DB monitor polls")
+    print(f"{'zone':>6} {'capacity':>9} {'max seen':>9}")
+    for zone in zones:
+        print(f"{zone:>6} {r['capacity'][zone]:>9} {r['max_seen'][zone]:>9}")
+    print(f"over-capacity observations: {len(r['violations'])}")
+    print(f"final state consistent (engine = cache = DB sessions = DB zones): {r['consistent']} {r['final']}")
+
+    naive = await run_naive(args, zones)
+    print(f"control (check-await-increment counter): max seen {naive.max_seen}, "
+          f"{len(naive.violations)} over-capacity observations")
+
+    ok = not r["violations"] and r["consistent"] and c["exited"] == c["admitted"]
+    print("capacity never exceeded:", "yes" if ok else "NO")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""Benchmark: gate event write throughput and latency per DB commit mode (sync / group / async).
+
+Run from the backend directory:
+    python -m benchmarks.db_writes [--cameras 8] [--cycles 200] [--synchronous NORMAL]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cameras", type=int, default=8)
+    parser.add_argument("--cycles", type=int, default=200, help="entry/pay/exit cycles per camera")
+    parser.add_argument("--modes", nargs="+", default=["sync", "group", "async"])
+    parser.add_argument("--window-ms", type=float, default=0)
+    parser.add_argument("--synchronous", default="NORMAL", help="SQLite synchronous pragma (NORMAL / FULL)")
+    return parser.parse_args()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(mode, args):
+    from sqlalchemy import select
+    from database import ParkingSession, make_writer, session_scope
+    from logic import ParkingSystem
+
+    os.environ["DB_COMMIT_WINDOW_MS"] = str(args.window_ms)
+    parking = ParkingSystem(capacity_a=args.cameras * args.cycles, writer=make_writer(mode))
+    await parking.start()
+    prefix = mode[:2].upper()
+    latencies = []
+
+    async def camera(idx):
+        for cycle in range(args.cycles):
+            plate = f"{prefix}{idx:02d}{cycle:05d}"
+            for step in (parking.process_entry, parking.pay, parking.process_exit):
+                start = time.perf_counter()
+                await step(plate)
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(camera(i) for i in range(args.cameras)))
+    elapsed = time.perf_counter() - start
+    await parking.close()
+    stats = parking.writer.stats()
+
+    expected = args.cameras * args.cycles
+    async with session_scope() as db:
+        rows = (await db.execute(
+            select(ParkingSession.is_paid, ParkingSession.exit_time).where(ParkingSession.plate.like(f"{prefix}%"))
+        )).all()
+    complete = sum(1 for is_paid, exit_time in rows if is_paid and exit_time is not None)
+
+    return {
+        "mode": mode,
+        "events_per_s": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "avg_batch": stats["avg_batch"],
+        "ok": len(rows) == expected and complete == expected,
+    }
+
+
+async def main():
+    args = parse_args()
+    # Scratch database; must be configured before `database` is imported
+    os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["SQLITE_SYNCHRONOUS"] = args.synchronous
+    from database import init_db
+    await init_db()
+
+    print(f"{args.cameras} cameras x {args.cycles} cycles, synchronous={args.synchronous}")
+    print(f"{'mode':>6} {'events/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'avg batch':>10} {'rows ok':>8}")
+    failed = False
+    for mode in args.modes:
+        r = await run(mode, args)
+        failed |= not r["ok"]
+        print(f"{r['mode']:>6} {r['events_per_s']:>10.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['avg_batch']:>10.1f} {str(r['ok']):>8}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
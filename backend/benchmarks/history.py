@@ -0,0 +1,218 @@
+"""Benchmark of the session queries with a large history, before and after archiving it.
+
+Run from the backend directory (10M rows take ~4 GB of disk):
+    python -m benchmarks.history [--rows 10000000] [--keep-days 90] [--dir /tmp/history-bench]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000, help="historical (closed) sessions")
+    parser.add_argument("--days", type=int, default=3 * 365, help="history spread over this many days")
+    parser.add_argument("--active", type=int, default=500, help="sessions still on the parking")
+    parser.add_argument("--keep-days", type=int, default=90, help="closed sessions younger than this stay hot")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--dir", help="working directory (default: a new temporary one)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def generate(path, rows, days, active, seed, chunk=500_000):
+    """Bulk-load sessions straight through sqlite3 (secondary indexes are built afterwards by init_db)."""
+    rng = np.random.default_rng(seed)
+    now = np.datetime64(datetime.datetime.now(), "us")
+    span_us = days * 86_400_000_000
+    letters = np.array(list("ABCDEFGHJKLMNPRSTUVWXYZ0123456789"))
+    as_text = lambda values: np.char.replace(values.astype("datetime64[us]").astype(str), "T", " ").tolist()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+    indexes = [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'parking_sessions' AND sql IS NOT NULL")]
+    for name in indexes:
+        conn.execute(f"DROP INDEX {name}")
+
+    total = rows + active
+    next_id = 1
+    for first in range(0, total, chunk):
+        n = min(chunk, total - first)
+        # Entry times in id order: closed history first, the active cars in the last hours
+        position = np.arange(first, first + n)
+        closed = position < rows
+        offsets = np.where(closed, (span_us * (1.0 - position / max(rows, 1))).astype(np.int64),
+                           rng.integers(60_000_000, 6 * 3_600_000_000, n))
+        entry = now - offsets.astype("timedelta64[us]")
+        stay = rng.integers(5 * 60_000_000, 10 * 3_600_000_000, n).astype("timedelta64[us]")
+        exit_ = np.where(closed, entry + stay, np.datetime64("NaT"))
+        paid = closed & (rng.random(n) < 0.95)
+        amount = np.where(paid, np.ceil(stay.astype(np.int64) / 3_600_000_000) * 2.0, 0.0)
+        plates = ["".join(p) for p in letters[rng.integers(0, len(letters), (n, 7))]]
+        zones = np.array(["A", "B", "C"])[rng.integers(0, 3, n)].tolist()
+        entry_text = as_text(entry)
+        exit_text = [value if is_closed else None for value, is_closed in zip(as_text(exit_), closed.tolist())]
+        updated = [e or s for e, s in zip(exit_text, entry_text)]
+        conn.executemany(
+            "INSERT INTO parking_sessions (id, plate, entry_time, exit_time, is_paid, amount_due, image_path, zone,"
+            " updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            zip(range(next_id, next_id + n), plates, entry_text, exit_text, paid.tolist(), amount.tolist(),
+                (f"/crops/{i:032x}" for i in range(next_id, next_id + n)), zones, updated),
+        )
+        conn.commit()
+        next_id += n
+        print(f"\r  generated {next_id - 1:,}/{total:,} sessions", end="", flush=True)
+    print()
+    conn.close()
+
+
+async def timed(fn, repeats):
+    from benchmarks.pipeline import latency
+    await fn()  # warm-up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        await fn()
+        times.append(time.perf_counter() - start)
+    return latency(times)
+
+
+def hot_queries(main, parking):
+    from sqlalchemy import func, select
+    from database import ParkingSession, SessionLocal, session_scope
+
+    async def logs(**filters):
+        params = dict(active=False, unpaid=False, plate_prefix=None, from_time=None, to_time=None,
+                      updated_since=None, cursor=None, limit=100)
+        params.update(filters)
+        async with SessionLocal() as db:
+            return await main.get_logs(db=db, **params)
+
+    async def zone_counts():
+        async with session_scope() as db:
+            return (await db.execute(
+                select(ParkingSession.zone, func.count()).where(ParkingSession.exit_time == None)
+                .group_by(ParkingSession.zone)
+            )).all()
+
+    recent = datetime.datetime.now() - datetime.timedelta(hours=1)
+    return {
+        "load active sessions": parking._load_active,
+        "active count per zone": zone_counts,
+        "max session id": parking._max_id,
+        "/logs first page": lambda: logs(),
+        "/logs active": lambda: logs(active=True),
+        "/logs unpaid": lambda: logs(unpaid=True),
+        "/logs plate prefix": lambda: logs(plate_prefix="WX"),
+        "/logs updated in 1 h": lambda: logs(updated_since=recent),
+    }
+
+
+def history_queries(main):
+    year_ago = datetime.datetime.now() - datetime.timedelta(days=365)
+    month = year_ago.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "/history first page": lambda: main.get_history(None, None, None, None, None, 100),
+        "/history a year back": lambda: main.get_history(None, None, year_ago, None, None, 100),
+        "/history plate prefix": lambda: main.get_history("WX", None, None, None, None, 100),
+        "/history/summary month": lambda: main.history_summary(None, month, (month + datetime.timedelta(days=32)).replace(day=1)),
+    }
+
+
+async def measure(queries, repeats):
+    return {name: await timed(fn, repeats) for name, fn in queries.items()}
+
+
+def count(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT count(*) FROM parking_sessions").fetchone()[0]
+
+
+async def main_async(args):
+    workdir = args.dir or tempfile.mkdtemp(prefix="history-bench-")
+    db_path = os.path.join(workdir, "parking.db")
+    os.environ.update(SQLITE_PATH=db_path, ARCHIVE_DIR=os.path.join(workdir, "archive"),
+                      CROP_STORE_DIR=os.path.join(workdir, "crops"), ROI_PROFILES_PATH="",
+                      ARCHIVE_AFTER_DAYS=str(args.keep_days))
+    import main
+    from database import engine, init_db
+
+    await init_db()
+    if count(db_path) != args.rows + args.active:
+        if count(db_path):
+            sys.exit(f"{db_path} holds a different data set; use an empty --dir")
+        print(f"building {args.rows:,} sessions over {args.days} days in {db_path}")
+        start = time.perf_counter()
+        await engine.dispose()  # release the pooled connections before the bulk load
+        generate(db_path, args.rows, args.days, args.active, args.seed)
+        await init_db()  # secondary indexes
+        print(f"  built in {time.perf_counter() - start:.0f} s")
+    size_before = os.path.getsize(db_path)
+
+    parking = main.parking
+    parking.writer.start()
+    active_before = {r.id for r in await parking._load_active()}
+    first_page = [row.id for row in (await hot_queries(main, parking)["/logs first page"]())["items"]]
+    before = await measure(hot_queries(main, parking), args.repeats)
+
+    print(f"archiving sessions closed more than {args.keep_days} days ago...")
+    result = await main.archiver.run()
+    hot_rows = count(db_path)
+    start = time.perf_counter()
+    await engine.dispose()  # pooled connections would keep the old WAL frames from being checkpointed
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    vacuum_s = time.perf_counter() - start
+
+    after = await measure(hot_queries(main, parking), args.repeats)
+    spanning = await measure(history_queries(main), args.repeats)
+    stats = await main.archiver.stats()
+    archived = sum(p["rows"] for p in stats["partitions"])
+    archive_mb = sum(p["size_mb"] for p in stats["partitions"])
+    active_after = {r.id for r in await parking._load_active()}
+    history_page = [row["id"] for row in (await main.get_history(None, None, None, None, None, 100))["items"]]
+    await parking.close()
+
+    print(f"\nhot table: {args.rows + args.active:,} rows, {size_before / 2**20:,.0f} MB -> {hot_rows:,} rows, "
+          f"{os.path.getsize(db_path) / 2**20:,.0f} MB after VACUUM ({vacuum_s:.1f} s)")
+    print(f"archived {result['moved']:,} sessions in {result['elapsed_s']:.1f} s "
+          f"({result['moved'] / max(result['elapsed_s'], 1e-9):,.0f} rows/s) into {len(stats['partitions'])} "
+          f"monthly partitions, {archive_mb:,.0f} MB")
+    print(f"\n{'query':>24} {'before p50 ms':>14} {'p95':>8} | {'after p50 ms':>13} {'p95':>8} {'speed-up':>9}")
+    for name in before:
+        b, a = before[name], after[name]
+        print(f"{name:>24} {b['p50_ms']:>14.3f} {b['p95_ms']:>8.3f} | {a['p50_ms']:>13.3f} {a['p95_ms']:>8.3f} "
+              f"{b['p50_ms'] / a['p50_ms']:>8.1f}x")
+    print(f"\n{'hot + archive query':>24} {'p50 ms':>14} {'p95':>8}")
+    for name, r in spanning.items():
+        print(f"{name:>24} {r['p50_ms']:>14.3f} {r['p95_ms']:>8.3f}")
+
+    problems = []
+    if archived + hot_rows != args.rows + args.active or archived != result["moved"]:
+        problems.append(f"row count: {archived:,} archived + {hot_rows:,} hot != {args.rows + args.active:,}")
+    if active_before != active_after:
+        problems.append("active sessions changed")
+    if history_page != first_page:
+        problems.append("first /history page differs from the first /logs page before archiving")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    print("archive consistent:", "yes" if not problems else "NO")
+    return not problems
+
+
+def run():
+    args = parse_args()
+    sys.exit(0 if asyncio.run(main_async(args)) else 1)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,136 @@
+"""Load test: /pay and /logs latency idle vs. while /process_frame is saturated.
+
+Run from the backend directory (needs httpx):
+    python -m benchmarks.load_test --url http://localhost:8000 --image ../images/frame.jpg
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+import httpx
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--image", default=None, help="frame to upload (default: first image in ../images)")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per phase")
+    parser.add_argument("--frame-concurrency", type=int, default=32)
+    parser.add_argument("--probe-rate", type=float, default=20.0, help="probe requests per second")
+    parser.add_argument("--max-ratio", type=float, default=2.0)
+    parser.add_argument("--slack-ms", type=float, default=20.0)
+    return parser.parse_args()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+def summary(latencies):
+    return {
+        "n": len(latencies),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000 if latencies else float("nan"),
+    }
+
+
+async def probe(client, plates, rate, stop):
+    """Open-loop probes: requests start on schedule, independent of how long earlier ones take."""
+    latencies = {"/logs": [], "/pay": []}
+    plate_cycle = itertools.cycle(plates or ["XX00000"])
+
+    async def one(endpoint):
+        start = time.perf_counter()
+        if endpoint == "/logs":
+            await client.get("/logs", params={"limit": 50})
+        else:
+            await client.post("/pay", json={"plate": next(plate_cycle)})
+        latencies[endpoint].append(time.perf_counter() - start)
+
+    tasks = []
+    for endpoint in itertools.cycle(latencies):
+        if stop.is_set():
+            break
+        tasks.append(asyncio.create_task(one(endpoint)))
+        await asyncio.sleep(1.0 / rate)
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+async def flood(url, image, concurrency, duration):
+    counts = {}
+    deadline = time.monotonic() + duration
+
+    async def client_loop(client):
+        while time.monotonic() < deadline:
+            response = await client.post("/process_frame", files={"file": ("frame.jpg", image, "image/jpeg")},
+                                         params={"mode": "exit", "camera_id": "loadtest"})
+            counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60.0, limits=limits) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+    return counts
+
+
+def flood_process(url, image, concurrency, duration, result):
+    # Separate process, so the probes' timings do not include the load generator's own event loop
+    result.update(asyncio.run(flood(url, image, concurrency, duration)))
+
+
+async def phase(client, args, plates, image=None):
+    stop = asyncio.Event()
+    counts = multiprocessing.Manager().dict()
+    flooder = None
+    if image:
+        flooder = multiprocessing.Process(
+            target=flood_process, args=(args.url, image, args.frame_concurrency, args.duration, counts))
+        flooder.start()
+    probes = asyncio.create_task(probe(client, plates, args.probe_rate, stop))
+    await asyncio.sleep(args.duration)
+    stop.set()
+    latencies = await probes
+    if flooder:
+        await asyncio.to_thread(flooder.join)
+    return {endpoint: summary(values) for endpoint, values in latencies.items()}, dict(counts)
+
+
+async def main():
+    args = parse_args()
+    image_path = args.image or sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "..", "images", "*.jpg")))[0]
+    with open(image_path, "rb") as f:
+        image = f.read()
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=60.0) as client:
+        plates = [s["plate"] for s in (await client.get("/fees/active")).json()["sessions"]]
+        if not plates:
+            print("No active sessions - /pay measures the not-found path")
+
+        idle, _ = await phase(client, args, plates)
+        saturated, counts = await phase(client, args, plates, image)
+
+    frames = sum(counts.values())
+    print(f"/process_frame: {frames} requests in {args.duration:.0f} s ({frames / args.duration:.1f}/s), "
+          f"status codes {dict(sorted(counts.items()))}")
+    print(f"{'endpoint':>10} {'phase':>10} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    flat = True
+    for endpoint in idle:
+        for name, result in (("idle", idle[endpoint]), ("saturated", saturated[endpoint])):
+            print(f"{endpoint:>10} {name:>10} {result['n']:>6} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                  f"{result['p99_ms']:>8.1f} {result['max_ms']:>8.1f}")
+        base, loaded = idle[endpoint]["p99_ms"], saturated[endpoint]["p99_ms"]
+        flat &= loaded <= max(base * args.max_ratio, base + args.slack_ms)
+    print("DB endpoint latency flat under frame load:", "yes" if flat else "NO")
+    sys.exit(0 if flat else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""Parity check and latency benchmark of the LPRNet backends (eager / TorchScript / ONNX Runtime).
+
+Run from the backend directory:
+    python -m benchmarks.lpr_backends --weights ../weights/lprnet_best.pth --images ../images
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from lpr_runtime import EagerLPR, OnnxLPR, TorchScriptLPR, export_onnx, export_torchscript
+from lprnet_arch import decode_lpr, preprocess_plates
+from quantize_models import grid_crops, load_images
+
+
+def latency_ms(runtime, batch, repeats):
+    runtime(batch)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        runtime(batch)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings)), float(np.percentile(timings, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="/app/weights/lprnet_best.pth")
+    parser.add_argument("--images", default="/app/images")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--atol", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    crops = grid_crops(load_images(args.images))
+    if not crops:
+        sys.exit(f"No images found in {args.images}")
+    inputs = preprocess_plates(crops, "cpu")
+
+    eager = EagerLPR(args.weights, "cpu")
+    tmp = tempfile.mkdtemp()
+    ts_path, onnx_path = os.path.join(tmp, "lprnet.ts.pt"), os.path.join(tmp, "lprnet.onnx")
+    export_torchscript(eager.model, ts_path)
+    export_onnx(eager.model, onnx_path)
+    runtimes = [eager, TorchScriptLPR(ts_path, "cpu"), OnnxLPR(onnx_path, threads=args.threads)]
+
+    reference_logits = eager(inputs)
+    reference = decode_lpr(reference_logits)
+    print(f"Parity on {len(crops)} crops from {args.images}")
+    failed = False
+    for runtime in runtimes[1:]:
+        logits = runtime(inputs)
+        max_diff = (logits - reference_logits).abs().max().item()
+        mismatches = sum(a != b for a, b in zip(decode_lpr(logits), reference))
+        ok = mismatches == 0 and max_diff <= args.atol
+        failed |= not ok
+        print(f"  {runtime.name:<12} max |dlogit| = {max_diff:.2e}  decode mismatches = {mismatches}  {'OK' if ok else 'FAIL'}")
+
+    print(f"\n{'backend':<12} {'batch':>6} {'p50 ms':>9} {'p95 ms':>9} {'ms/plate':>9}")
+    for runtime in runtimes:
+        for batch_size in args.batch_sizes:
+            batch = inputs[np.arange(batch_size) % len(crops)]
+            p50, p95 = latency_ms(runtime, batch, args.repeats)
+            print(f"{runtime.name:<12} {batch_size:>6} {p50:>9.2f} {p95:>9.2f} {p50 / batch_size:>9.3f}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
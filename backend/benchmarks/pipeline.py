@@ -0,0 +1,396 @@
+"""Offline benchmark and accuracy suite of the detection + recognition pipeline.
+
+Labels of real images are read from <images>/labels.json:
+    {"frame.jpg": [{"plate": "WX12345", "box": [x1, y1, x2, y2]}], ...}
+
+Run from the backend directory:
+    python -m benchmarks.pipeline --synthetic 500 --detector oracle --weights-dir ../weights --json report.json
+    python -m benchmarks.pipeline --images ../images --weights-dir ../weights --compare report.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+import cv2
+import Levenshtein
+import numpy as np
+
+from benchmarks.plate_index import random_plate
+from executor import decode_image
+from lprnet_arch import decode_lpr, preprocess_plates
+from models import ModelRegistry
+from plate_index import PlateIndex
+from roi import DetectionRegions
+
+CAMERA = "benchmark"
+STAGES = ("decode", "detect", "crop", "preprocess", "recognize", "decode_lpr", "match")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--images", help="directory of JPEG frames (labels from labels.json)")
+    source.add_argument("--synthetic", type=int, help="number of synthetic frames to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--weights-dir", default="/app/weights")
+    parser.add_argument("--lpr-backend", default="eager", help="eager / torchscript / onnx")
+    parser.add_argument("--detector", default="yolo", choices=("yolo", "oracle"))
+    parser.add_argument("--roi", help="configured camera region, fractions of the frame (default: whole frame)")
+    parser.add_argument("--target-size", type=int, default=640)
+    parser.add_argument("--min-size", type=int, default=320)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--active", type=int, default=1000, help="active sessions in the plate index")
+    parser.add_argument("--repeats", type=int, default=50, help="repetitions of each isolated stage")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="earlier report to check for regressions")
+    parser.add_argument("--max-slowdown", type=float, default=0.10, help="allowed throughput / p95 regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore latency changes smaller than this")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01)
+    return parser.parse_args()
+
+
+# --- Frames -----------------------------------------------------------------
+
+def render_plate(text):
+    """White plate with a blue EU band and black characters, roughly 520 x 114 like a real plate."""
+    plate = np.full((114, 520, 3), 245, dtype=np.uint8)
+    plate[:, :48] = (160, 60, 0)
+    cv2.rectangle(plate, (0, 0), (519, 113), (20, 20, 20), 4)
+    scale = 2.6 if len(text) <= 7 else 2.3
+    (width, height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_DUPLEX, scale, 6)
+    origin = (48 + (472 - width) // 2, (114 + height) // 2)
+    cv2.putText(plate, text, origin, cv2.FONT_HERSHEY_DUPLEX, scale, (15, 15, 15), 6, cv2.LINE_AA)
+    return plate
+
+
+def synthetic_frame(rng, np_rng):
+    """One 1280x720 JPEG frame with a single plate; returns (bytes, [label])."""
+    frame = np_rng.integers(40, 200, size=(720, 1280, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (0, 0), 6)
+    text = random_plate(rng)
+    width = rng.randint(140, 320)
+    plate = cv2.resize(render_plate(text), (width, int(width * 114 / 520)), interpolation=cv2.INTER_AREA)
+    x, y = rng.randint(0, 1280 - plate.shape[1]), rng.randint(0, 720 - plate.shape[0])
+    frame[y:y + plate.shape[0], x:x + plate.shape[1]] = plate
+    noise = np_rng.normal(0, 4, frame.shape)
+    frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+    ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    box = [x, y, x + plate.shape[1], y + plate.shape[0]]
+    return jpeg.tobytes(), [{"plate": text, "box": box}]
+
+
+def load_frames(args):
+    """List of (name, jpeg bytes, labels or None)."""
+    if args.synthetic:
+        rng, np_rng = random.Random(args.seed), np.random.default_rng(args.seed)
+        return [(f"synthetic_{i:05d}", *synthetic_frame(rng, np_rng)) for i in range(args.synthetic)]
+
+    labels = {}
+    labels_path = os.path.join(args.images, "labels.json")
+    if os.path.exists(labels_path):
+        with open(labels_path) as f:
+            labels = json.load(f)
+    frames = []
+    for path in sorted(glob.glob(os.path.join(args.images, "*.jpg"))):
+        with open(path, "rb") as f:
+            name = os.path.basename(path)
+            frames.append((name, f.read(), labels.get(name)))
+    return frames
+
+
+# --- Stages -----------------------------------------------------------------
+
+def crop_plates(img, boxes):
+    """Same edge-clamped crops as run_inference in main.py."""
+    crops = []
+    for x1, y1, x2, y2 in boxes:
+        crop = img[max(0, y1):min(img.shape[0], y2), max(0, x1):min(img.shape[1], x2)]
+        if crop.size > 0:
+            crops.append(crop)
+    return crops
+
+
+def yolo_boxes(yolo, regions, img):
+    """Plate boxes in full-frame pixels, detected on the camera region as run_inference does."""
+    region, plan = regions.prepare(img, CAMERA)
+    result = yolo(region, imgsz=plan.imgsz, verbose=False)[0]
+    return [[int(v) for v in plan.to_frame([float(v) for v in box.xyxy[0]])]
+            for box in result.boxes if int(box.cls[0]) == 0]
+
+
+class Pipeline:
+    def __init__(self, models, detector, index, regions):
+        self.models = models
+        self.detector = detector
+        self.index = index
+        self.regions = regions
+
+    def detect(self, img, labels):
+        if self.detector == "oracle":
+            return [label["box"] for label in labels or [] if "box" in label]
+        return yolo_boxes(self.models.yolo, self.regions, img)
+
+    def run(self, contents, labels, timings):
+        """One frame through every stage; appends each stage's seconds to `timings`."""
+        def timed(stage, fn, *args):
+            start = time.perf_counter()
+            result = fn(*args)
+            timings[stage].append(time.perf_counter() - start)
+            return result
+
+        img = timed("decode", decode_image, contents)
+        boxes = timed("detect", self.detect, img, labels)
+        crops = timed("crop", crop_plates, img, boxes)
+        if not crops:
+            return boxes, [], []
+        batch = timed("preprocess", self.models.preprocess, crops, self.models.device)
+        logits = timed("recognize", self.models.lpr, batch)
+        texts = timed("decode_lpr", decode_lpr, logits)
+        matches = timed("match", lambda: [self.index.best_match(text) for text in texts])
+        return boxes, texts, matches
+
+
+# --- Measurements -----------------------------------------------------------
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def latency(values):
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "n": len(values),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 0.5)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+    }
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def run_pipeline(pipeline, frames, session_ids):
+    timings = {stage: [] for stage in STAGES}
+    frame_times = []
+    acc = {"labelled_plates": 0, "boxed": 0, "detected": 0, "read": 0, "exact": 0, "char_errors": 0, "chars": 0, "matched": 0}
+
+    start = time.perf_counter()
+    for _, contents, labels in frames:
+        frame_start = time.perf_counter()
+        boxes, texts, matches = pipeline.run(contents, labels, timings)
+        frame_times.append(time.perf_counter() - frame_start)
+        if labels is None:
+            continue
+        for label in labels:
+            acc["labelled_plates"] += 1
+            acc["chars"] += len(label["plate"])
+            # Reading of the detection overlapping the label (or the only reading when boxes are unlabelled)
+            hit = None
+            if "box" in label:
+                overlaps = [(iou(label["box"], box), i) for i, box in enumerate(boxes[:len(texts)])]
+                best = max(overlaps, default=(0.0, None))
+                hit = best[1] if best[0] >= 0.5 else None
+                acc["boxed"] += 1
+                acc["detected"] += any(iou(label["box"], box) >= 0.5 for box in boxes)
+            elif texts:
+                hit = min(range(len(texts)), key=lambda i: Levenshtein.distance(texts[i], label["plate"]))
+            if hit is None:
+                acc["char_errors"] += len(label["plate"])
+                continue
+            acc["read"] += 1
+            acc["exact"] += texts[hit] == label["plate"]
+            acc["char_errors"] += min(len(label["plate"]), Levenshtein.distance(texts[hit], label["plate"]))
+            acc["matched"] += matches[hit] is not None and matches[hit][1] == session_ids.get(label["plate"])
+    elapsed = time.perf_counter() - start
+
+    plates = acc["labelled_plates"]
+    accuracy = None
+    if plates:
+        accuracy = {
+            "labelled_plates": plates,
+            # With the oracle detector the boxes are the labels themselves
+            "detection_recall_iou50": acc["detected"] / acc["boxed"]
+            if acc["boxed"] and pipeline.detector == "yolo" else None,
+            "plate_exact_match": acc["exact"] / plates,
+            "char_accuracy": 1 - acc["char_errors"] / acc["chars"],
+            "session_match": acc["matched"] / plates,
+        }
+    return {
+        "frames": len(frames),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_fps": round(len(frames) / elapsed, 2),
+        "latency": latency(frame_times),
+        "stages": {stage: latency(values) for stage, values in timings.items() if values},
+    }, accuracy
+
+
+def stage_inputs(pipeline, frames):
+    """Cached input of every stage for the isolated runs (first frame with a plate)."""
+    for _, contents, labels in frames:
+        img = decode_image(contents)
+        boxes = pipeline.detect(img, labels)
+        crops = crop_plates(img, boxes)
+        if crops:
+            batch = preprocess_plates(crops, pipeline.models.device)
+            logits = pipeline.models.lpr(batch)
+            texts = decode_lpr(logits)
+            return {
+                "decode": (decode_image, contents),
+                "detect": (pipeline.detect, img, labels),
+                "crop": (crop_plates, img, boxes),
+                "preprocess": (pipeline.models.preprocess, crops, pipeline.models.device),
+                "recognize": (pipeline.models.lpr, batch),
+                "decode_lpr": (decode_lpr, logits),
+                "match": (lambda: [pipeline.index.best_match(text) for text in texts],),
+            }
+    return None
+
+
+def run_stages(inputs, repeats):
+    report = {}
+    for stage, (fn, *args) in inputs.items():
+        fn(*args)  # warm-up
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn(*args)
+            timings.append(time.perf_counter() - start)
+        # Allocation peak in a separate call, so tracing does not slow down the timed runs
+        tracemalloc.start()
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report[stage] = {**latency(timings), "ops_per_s": round(repeats / sum(timings), 1),
+                         "alloc_peak_kb": round(peak / 1024, 1)}
+    return report
+
+
+def compare(report, baseline, args):
+    """Regressions of `report` against `baseline` as a list of messages."""
+    problems = []
+    slower = lambda before, after: after > max(before * (1 + args.max_slowdown), before + args.min_delta_ms)
+    old, new = baseline["pipeline"], report["pipeline"]
+    if new["throughput_fps"] < old["throughput_fps"] * (1 - args.max_slowdown):
+        problems.append(f"throughput {old['throughput_fps']} -> {new['throughput_fps']} frames/s")
+    if slower(old["latency"]["p95_ms"], new["latency"]["p95_ms"]):
+        problems.append(f"pipeline p95 {old['latency']['p95_ms']} -> {new['latency']['p95_ms']} ms")
+    for stage, values in report["stages"].items():
+        before = baseline["stages"].get(stage)
+        if before and slower(before["p95_ms"], values["p95_ms"]):
+            problems.append(f"{stage} p95 {before['p95_ms']} -> {values['p95_ms']} ms")
+    for key, value in (report["accuracy"] or {}).items():
+        before = (baseline.get("accuracy") or {}).get(key)
+        if key != "labelled_plates" and value is not None and before is not None \
+                and value < before - args.max_accuracy_drop:
+            problems.append(f"{key} {before:.4f} -> {value:.4f}")
+    return problems
+
+
+def main():
+    args = parse_args()
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    frames = load_frames(args)
+    if not frames:
+        sys.exit("No frames to benchmark")
+
+    models = ModelRegistry(
+        os.path.join(args.weights_dir, "best.pt"), args.lpr_backend,
+        lpr_weights=os.path.join(args.weights_dir, "lprnet_best.pth"),
+        torchscript_path=os.path.join(args.weights_dir, "lprnet.ts.pt"),
+        onnx_path=os.path.join(args.weights_dir, "lprnet.onnx"),
+        lpr_threads=args.threads,
+    )
+    models.start()
+    models.wait()
+    needed = ["lpr"] + (["yolo"] if args.detector == "yolo" else [])
+    failed = [name for name in needed if models.status[name].state != "ready"]
+    if failed:
+        sys.exit(f"Model(s) not loaded: {', '.join(failed)} (use --detector oracle without YOLO weights)")
+
+    # Active sessions: every labelled plate plus random ones up to --active
+    rng = random.Random(args.seed + 1)
+    plates = {label["plate"] for _, _, labels in frames for label in labels or []}
+    while len(plates) < args.active:
+        plates.add(random_plate(rng))
+    session_ids = {plate: i for i, plate in enumerate(sorted(plates), start=1)}
+    index = PlateIndex(max_distance=2)
+    for plate, session_id in session_ids.items():
+        index.add(plate, session_id)
+
+    configured = {CAMERA: [float(v) for v in args.roi.split(",")]} if args.roi else None
+    regions = DetectionRegions(target_size=args.target_size, min_size=args.min_size, configured=configured, learn=False)
+    pipeline = Pipeline(models, args.detector, index, regions)
+    pipeline.run(frames[0][1], frames[0][2], {stage: [] for stage in STAGES})  # warm-up
+    pipeline_report, accuracy = run_pipeline(pipeline, frames, session_ids)
+    inputs = stage_inputs(pipeline, frames)
+    stages_report = run_stages(inputs, args.repeats) if inputs else {}
+
+    report = {
+        "config": {
+            "source": args.images or f"synthetic:{args.synthetic}:seed={args.seed}",
+            "detector": args.detector, "lpr_backend": args.lpr_backend, "device": str(models.device),
+            "threads": args.threads, "active_sessions": len(session_ids), "repeats": args.repeats,
+            "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+        },
+        "models": models.stats()["models"],
+        "pipeline": pipeline_report,
+        "stages": stages_report,
+        "accuracy": accuracy,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+    p = pipeline_report
+    print(f"{p['frames']} frames ({report['config']['source']}), detector {args.detector}, "
+          f"LPRNet {args.lpr_backend} on {report['config']['device']}")
+    print(f"pipeline: {p['throughput_fps']:.1f} frames/s, p50 {p['latency']['p50_ms']:.2f} ms, "
+          f"p95 {p['latency']['p95_ms']:.2f} ms, p99 {p['latency']['p99_ms']:.2f} ms, max RSS {report['max_rss_mb']} MB")
+    print(f"\n{'stage':>11} {'in pipeline p50':>16} {'p95':>8} {'p99':>8} | {'isolated p50':>13} {'p95':>8} "
+          f"{'ops/s':>9} {'alloc KB':>9}")
+    for stage in STAGES:
+        in_pipe, alone = p["stages"].get(stage), stages_report.get(stage)
+        if not in_pipe and not alone:
+            continue
+        left = f"{in_pipe['p50_ms']:>16.3f} {in_pipe['p95_ms']:>8.3f} {in_pipe['p99_ms']:>8.3f}" if in_pipe else f"{'-':>34}"
+        right = (f"{alone['p50_ms']:>13.3f} {alone['p95_ms']:>8.3f} {alone['ops_per_s']:>9.1f} "
+                 f"{alone['alloc_peak_kb']:>9.1f}") if alone else ""
+        print(f"{stage:>11} {left} | {right}")
+    if accuracy:
+        recall = accuracy["detection_recall_iou50"]
+        print(f"\naccuracy on {accuracy['labelled_plates']} plates: "
+              f"detection recall {'-' if recall is None else f'{recall:.1%}'}, "
+              f"exact match {accuracy['plate_exact_match']:.1%}, char accuracy {accuracy['char_accuracy']:.1%}, "
+              f"session match {accuracy['session_match']:.1%}")
+    else:
+        print("\naccuracy: no labels")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            problems = compare(report, json.load(f), args)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        print(f"compared with {args.compare}: {'REGRESSED' if problems else 'ok'}")
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark: PlateIndex vs the sequential Levenshtein scan used by process_exit.
+
+Run from the backend directory:
+    python -m benchmarks.plate_index [--sizes 1000 10000 100000] [--queries 1000]
+"""
+import argparse
+import random
+import string
+import time
+
+import Levenshtein
+
+from plate_index import PlateIndex
+
+ALNUM = string.ascii_uppercase + string.digits
+
+
+def random_plate(rng):
+    # Polish-style plate: 2-3 letter district code + 4-5 alphanumerics
+    prefix = "".join(rng.choices(string.ascii_uppercase, k=rng.choice((2, 3))))
+    return prefix + "".join(rng.choices(ALNUM, k=rng.choice((4, 5))))
+
+
+def mutate(plate, rng, edits):
+    chars = list(plate)
+    for _ in range(edits):
+        op = rng.choice(("sub", "del", "ins"))
+        pos = rng.randrange(len(chars))
+        if op == "sub":
+            chars[pos] = rng.choice(ALNUM)
+        elif op == "del" and len(chars) > 1:
+            del chars[pos]
+        else:
+            chars.insert(pos, rng.choice(ALNUM))
+    return "".join(chars)
+
+
+def linear_scan(plate, sessions):
+    """Reference implementation: the original full scan from ParkingSystem.process_exit."""
+    found = None
+    best_dist = 3 # threshold
+    for session_id, sess_plate in sessions:
+        dist = Levenshtein.distance(plate, sess_plate)
+        if dist <= 2 and dist < best_dist:
+            found = session_id
+            best_dist = dist
+    return found
+
+
+def run(size, n_queries, rng):
+    plates = set()
+    while len(plates) < size:
+        plates.add(random_plate(rng))
+    sessions = list(enumerate(sorted(plates), start=1))
+
+    start = time.perf_counter()
+    index = PlateIndex(max_distance=2)
+    for session_id, plate in sessions:
+        index.add(plate, session_id)
+    build_s = time.perf_counter() - start
+
+    # Mix of exact reads, OCR errors of 1-2 edits and unknown plates
+    queries = [mutate(rng.choice(sessions)[1], rng, rng.choice((0, 1, 2))) for _ in range(n_queries * 3 // 4)]
+    queries += [random_plate(rng) for _ in range(n_queries - len(queries))]
+
+    start = time.perf_counter()
+    expected = [linear_scan(q, sessions) for q in queries]
+    scan_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    got = [index.best_match(q) for q in queries]
+    index_s = time.perf_counter() - start
+
+    mismatches = sum(1 for e, g in zip(expected, got) if e != (g[1] if g else None))
+    return {
+        "active_sessions": size,
+        "queries": n_queries,
+        "build_ms": build_s * 1000,
+        "scan_us_per_query": scan_s / n_queries * 1e6,
+        "index_us_per_query": index_s / n_queries * 1e6,
+        "speedup": scan_s / index_s if index_s else float("inf"),
+        "mismatches": mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'sessions':>10} {'build ms':>10} {'scan us/q':>12} {'index us/q':>12} {'speedup':>9} {'mismatch':>9}")
+    for size in args.sizes:
+        r = run(size, args.queries, rng)
+        print(f"{r['active_sessions']:>10} {r['build_ms']:>10.1f} {r['scan_us_per_query']:>12.1f} "
+              f"{r['index_us_per_query']:>12.1f} {r['speedup']:>8.1f}x {r['mismatches']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark: LPRNet input preprocessing, the original per-crop path vs preallocated buffers.
+
+Run from the backend directory:
+    python -m benchmarks.preprocess --images ../images [--batch-sizes 1 8 32]
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+from lprnet_arch import PlatePreprocessor, preprocess_plates
+from quantize_models import grid_crops, load_images
+
+
+def reference(crops, device):
+    """The original implementation of preprocess_plates."""
+    batch = np.stack([cv2.resize(crop, (94, 24)) for crop in crops]).astype('float32')
+    batch = (batch - 127.5) * 0.0078125
+    return torch.from_numpy(batch).permute(0, 3, 1, 2).contiguous().to(device)
+
+
+def latency_us(fn, crops, repeats):
+    fn(crops, "cpu")  # warm-up (and buffer allocation of the preallocated variant)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(crops, "cpu")
+        timings.append((time.perf_counter() - start) * 1e6)
+    return float(np.median(timings)), float(np.percentile(timings, 95))
+
+
+def allocations(fn, crops):
+    """(NumPy peak KB, torch KB allocated, torch allocations) of one call."""
+    tracemalloc.start()
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn(crops, "cpu")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    torch_events = [e for e in prof.key_averages() if e.self_cpu_memory_usage > 0]
+    torch_bytes = sum(e.self_cpu_memory_usage for e in torch_events)
+    return peak / 1024, torch_bytes / 1024, sum(e.count for e in torch_events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="/app/images")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=500)
+    args = parser.parse_args()
+
+    crops = grid_crops(load_images(args.images))
+    if not crops:
+        sys.exit(f"No images found in {args.images}")
+    variants = [("reference", reference), ("preprocess", preprocess_plates), ("preallocated", PlatePreprocessor())]
+
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True):
+        pass  # the profiler's own one-off setup must not count against the first variant
+    print(f"{len(crops)} crops from {args.images}")
+    print(f"{'variant':>13} {'batch':>6} {'p50 us':>9} {'p95 us':>9} {'us/plate':>9} "
+          f"{'numpy KB':>9} {'torch KB':>9} {'torch allocs':>12}")
+    failed = False
+    for batch_size in args.batch_sizes:
+        batch = [crops[i % len(crops)] for i in range(batch_size)]
+        expected = reference(batch, "cpu")
+        for name, fn in variants:
+            if not torch.equal(fn(batch, "cpu"), expected):
+                print(f"{name}: output differs from the reference")
+                failed = True
+            p50, p95 = latency_us(fn, batch, args.repeats)
+            numpy_kb, torch_kb, torch_allocs = allocations(fn, batch)
+            print(f"{name:>13} {batch_size:>6} {p50:>9.1f} {p95:>9.1f} {p50 / batch_size:>9.2f} "
+                  f"{numpy_kb:>9.1f} {torch_kb:>9.1f} {torch_allocs:>12}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Accuracy-vs-latency report of the INT8 models against FP32.
+
+Run from the backend directory:
+    python -m benchmarks.quantization_report --images ../images --weights-dir ../weights
+"""
+import argparse
+import json
+import os
+import time
+
+import Levenshtein
+import numpy as np
+
+from lpr_runtime import EagerLPR, OnnxLPR
+from lprnet_arch import decode_lpr, preprocess_plates
+from quantize_models import detect_plate_crops, grid_crops, load_images
+
+
+def timed(fn, *args, repeats=20):
+    fn(*args)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, float(np.median(timings))
+
+
+def string_agreement(reference, candidate):
+    exact = sum(a == b for a, b in zip(reference, candidate))
+    chars = sum(max(len(a), len(b)) for a, b in zip(reference, candidate))
+    errors = sum(Levenshtein.distance(a, b) for a, b in zip(reference, candidate))
+    return {
+        "samples": len(reference),
+        "exact_match": exact / len(reference) if reference else 1.0,
+        "char_agreement": 1 - errors / chars if chars else 1.0,
+    }
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def plate_boxes(result):
+    return [list(map(float, box.xyxy[0])) for box in result.boxes if int(box.cls[0]) == 0]
+
+
+def lpr_report(weights_dir, crops):
+    fp32 = EagerLPR(os.path.join(weights_dir, "lprnet_best.pth"), "cpu")
+    int8 = OnnxLPR(os.path.join(weights_dir, "lprnet.int8.onnx"))
+    batch = preprocess_plates(crops, "cpu")
+    single = batch[:1]
+
+    ref_logits, fp32_ms = timed(fp32, batch)
+    int8_logits, int8_ms = timed(int8, batch)
+    _, fp32_single_ms = timed(fp32, single)
+    _, int8_single_ms = timed(int8, single)
+    return {
+        **string_agreement(decode_lpr(ref_logits), decode_lpr(int8_logits)),
+        "fp32_ms_batch": fp32_ms, "int8_ms_batch": int8_ms,
+        "fp32_ms_single": fp32_single_ms, "int8_ms_single": int8_single_ms,
+        "batch_size": len(crops),
+    }
+
+
+def yolo_report(weights_dir, images):
+    from ultralytics import YOLO
+
+    fp32 = YOLO(os.path.join(weights_dir, "best.pt"))
+    int8 = YOLO(os.path.join(weights_dir, "best.int8.onnx"), task="detect")
+    fp32_results, fp32_ms = timed(lambda: fp32(images, verbose=False), repeats=5)
+    int8_results, int8_ms = timed(lambda: int8(images, verbose=False), repeats=5)
+
+    matched = total = 0
+    for ref, cand in zip(fp32_results, int8_results):
+        ref_boxes, cand_boxes = plate_boxes(ref), plate_boxes(cand)
+        total += len(ref_boxes)
+        matched += sum(any(iou(r, c) >= 0.5 for c in cand_boxes) for r in ref_boxes)
+
+    # End-to-end: each pipeline detects and reads with its own models
+    fp32_lpr = EagerLPR(os.path.join(weights_dir, "lprnet_best.pth"), "cpu")
+    int8_lpr = OnnxLPR(os.path.join(weights_dir, "lprnet.int8.onnx"))
+    fp32_plates, int8_plates = [], []
+    for img in images:
+        fp32_crops, int8_crops = detect_plate_crops(fp32, [img]), detect_plate_crops(int8, [img])
+        fp32_plates.append(",".join(sorted(decode_lpr(fp32_lpr(preprocess_plates(fp32_crops, "cpu"))))) if fp32_crops else "")
+        int8_plates.append(",".join(sorted(decode_lpr(int8_lpr(preprocess_plates(int8_crops, "cpu"))))) if int8_crops else "")
+
+    return {
+        "frames": len(images),
+        "detection_recall_iou50": matched / total if total else 1.0,
+        "end_to_end": string_agreement(fp32_plates, int8_plates),
+        "fp32_ms_batch": fp32_ms, "int8_ms_batch": int8_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="/app/images")
+    parser.add_argument("--weights-dir", default="/app/weights")
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    has_yolo = all(os.path.exists(os.path.join(args.weights_dir, name)) for name in ("best.pt", "best.int8.onnx"))
+
+    crops = []
+    if has_yolo:
+        from ultralytics import YOLO
+        crops = detect_plate_crops(YOLO(os.path.join(args.weights_dir, "best.pt")), images)
+    crops = crops or grid_crops(images)
+
+    report = {"lprnet": lpr_report(args.weights_dir, crops)}
+    if has_yolo:
+        report["yolo"] = yolo_report(args.weights_dir, images)
+
+    lpr = report["lprnet"]
+    print(f"LPRNet INT8 vs FP32 on {lpr['samples']} crops: exact match {lpr['exact_match']:.1%}, "
+          f"char agreement {lpr['char_agreement']:.1%}")
+    print(f"  latency single: {lpr['fp32_ms_single']:.2f} ms -> {lpr['int8_ms_single']:.2f} ms, "
+          f"batch {lpr['batch_size']}: {lpr['fp32_ms_batch']:.1f} ms -> {lpr['int8_ms_batch']:.1f} ms")
+    if has_yolo:
+        yolo = report["yolo"]
+        print(f"YOLO INT8 vs FP32 on {yolo['frames']} frames: recall@IoU0.5 {yolo['detection_recall_iou50']:.1%}, "
+              f"end-to-end exact match {yolo['end_to_end']['exact_match']:.1%}")
+        print(f"  latency batch: {yolo['fp32_ms_batch']:.1f} ms -> {yolo['int8_ms_batch']:.1f} ms")
+    else:
+        print("YOLO: best.pt / best.int8.onnx not found, detector comparison skipped")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
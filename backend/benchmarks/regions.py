@@ -0,0 +1,160 @@
+"""Benchmark of region-of-interest cropping and resolution-adaptive detection on 1080p / 4K frames.
+
+Run from the backend directory:
+    python -m benchmarks.regions [--weights ../weights/best.pt] [--resolutions 1920x1080,3840x2160] [--frames 30]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.pipeline import iou, latency, render_plate
+from benchmarks.plate_index import random_plate
+from roi import DetectionRegions
+
+CONFIGS = ("baseline", "full", "config", "learned")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="../weights/best.pt")
+    parser.add_argument("--arch", default="yolov8n.yaml", help="untrained architecture timed when --weights is missing")
+    parser.add_argument("--resolutions", default="1920x1080,3840x2160")
+    parser.add_argument("--frames", type=int, default=30, help="measured frames per resolution and config")
+    parser.add_argument("--learn-frames", type=int, default=60, help="frames whose plate boxes train the learned region")
+    parser.add_argument("--roi", default="0.25,0.45,0.75,1.0", help="configured region, fractions of the frame")
+    parser.add_argument("--target-size", type=int, default=640)
+    parser.add_argument("--min-size", type=int, default=320)
+    parser.add_argument("--max-recall-drop", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+class GateFrames:
+    """Frames of one resolution: a few shared backgrounds, a fresh plate pasted per frame."""
+
+    def __init__(self, width, height, seed, backgrounds=3):
+        self.width, self.height = width, height
+        self.rng = random.Random(seed)
+        np_rng = np.random.default_rng(seed)
+        self.backgrounds = []
+        for _ in range(backgrounds):
+            # Blur at a fraction of the size, so 4K backgrounds stay cheap to generate
+            small = np_rng.integers(40, 200, size=(height // 4, width // 4, 3), dtype=np.uint8)
+            small = cv2.GaussianBlur(small, (0, 0), 2)
+            self.backgrounds.append(cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR))
+
+    def next(self):
+        """(frame, plate box) - the plate is ~12% of the frame wide, somewhere in the lower middle."""
+        rng = self.rng
+        frame = self.backgrounds[rng.randrange(len(self.backgrounds))].copy()
+        plate_w = int(self.width * rng.uniform(0.09, 0.15))
+        plate = cv2.resize(render_plate(random_plate(rng)), (plate_w, int(plate_w * 114 / 520)),
+                           interpolation=cv2.INTER_AREA)
+        x = rng.randint(int(0.3 * self.width), int(0.7 * self.width) - plate_w)
+        y = rng.randint(int(0.55 * self.height), int(0.92 * self.height) - plate.shape[0])
+        frame[y:y + plate.shape[0], x:x + plate.shape[1]] = plate
+        return frame, [x, y, x + plate.shape[1], y + plate.shape[0]]
+
+
+def load_detector(args):
+    from ultralytics import YOLO
+    if os.path.exists(args.weights):
+        return YOLO(args.weights, task="detect"), True
+    print(f"{args.weights} not found - timing the untrained {args.arch} architecture (latency only, no recall)")
+    return YOLO(args.arch, task="detect"), False
+
+
+def detect(yolo, config, regions, frame):
+    """Plate boxes in full-frame pixels, the plan used (None for baseline) and the elapsed seconds."""
+    start = time.perf_counter()
+    if config == "baseline":
+        result = yolo(frame, verbose=False)[0]
+        boxes = [list(map(int, box.xyxy[0])) for box in result.boxes if int(box.cls[0]) == 0]
+        return boxes, None, time.perf_counter() - start
+    image, plan = regions.prepare(frame, config)
+    result = yolo(image, imgsz=plan.imgsz, verbose=False)[0]
+    boxes = [[int(v) for v in plan.to_frame([float(v) for v in box.xyxy[0]])]
+             for box in result.boxes if int(box.cls[0]) == 0]
+    return boxes, plan, time.perf_counter() - start
+
+
+def mapping_error(plan, box):
+    """Round trip of a full-frame box through detector coordinates, in detector pixels."""
+    forward = [(box[0] - plan.x1) * plan.scale, (box[1] - plan.y1) * plan.scale,
+               (box[2] - plan.x1) * plan.scale, (box[3] - plan.y1) * plan.scale]
+    back = plan.to_frame(forward)
+    return max(abs(a - b) for a, b in zip(back, box)) * plan.scale
+
+
+def run_resolution(yolo, trained, width, height, args):
+    regions = DetectionRegions(target_size=args.target_size, min_size=args.min_size,
+                               configured={"config": [float(v) for v in args.roi.split(",")]},
+                               explore_every=10 ** 9, path=None)
+    frames = GateFrames(width, height, args.seed)
+    for _ in range(args.learn_frames):
+        _, box = frames.next()
+        regions.learn("learned", [box], (height, width))
+
+    warm, _ = frames.next()
+    rows = {}
+    for config in CONFIGS:
+        detect(yolo, config, regions, warm)
+        times, plate_px, hits, worst_error = [], [], 0, 0.0
+        imgsz, source = None, None
+        for _ in range(args.frames):
+            frame, box = frames.next()
+            boxes, plan, elapsed = detect(yolo, config, regions, frame)
+            times.append(elapsed)
+            hits += any(iou(found, box) >= 0.5 for found in boxes)
+            # ultralytics letterboxes the full frame to 640 on its long side
+            scale = plan.scale if plan else 640 / max(width, height)
+            plate_px.append((box[2] - box[0]) * scale)
+            if plan:
+                imgsz, source = plan.imgsz, plan.source
+                inside = plan.x1 <= box[0] and plan.y1 <= box[1] and box[2] <= plan.x2 and box[3] <= plan.y2
+                if inside:
+                    worst_error = max(worst_error, mapping_error(plan, box))
+        rows[config] = {
+            "imgsz": imgsz or 640, "source": source or "-", "latency": latency(times),
+            "plate_px": sum(plate_px) / len(plate_px), "recall": hits / args.frames if trained else None,
+            "mapping_error_px": worst_error,
+        }
+    return rows, regions.stats()["cameras"]["learned"]["learned"]
+
+
+def main():
+    args = parse_args()
+    yolo, trained = load_detector(args)
+    failures = []
+    for resolution in args.resolutions.split(","):
+        width, height = (int(v) for v in resolution.split("x"))
+        rows, learned = run_resolution(yolo, trained, width, height, args)
+        base = rows["baseline"]["latency"]["p50_ms"]
+        print(f"\n{width}x{height}: configured region {args.roi}, learned region {learned}, "
+              f"plate in the LPRNet crop ~{int(0.12 * width)} px wide (full resolution)")
+        print(f"{'config':>9} {'source':>8} {'imgsz':>6} {'p50 ms':>8} {'p95 ms':>8} {'speed-up':>9} "
+              f"{'plate px':>9} {'recall':>7} {'map err':>8}")
+        for config, r in rows.items():
+            recall = "-" if r["recall"] is None else f"{r['recall']:.0%}"
+            print(f"{config:>9} {r['source']:>8} {r['imgsz']:>6} {r['latency']['p50_ms']:>8.1f} "
+                  f"{r['latency']['p95_ms']:>8.1f} {base / r['latency']['p50_ms']:>8.2f}x {r['plate_px']:>9.1f} "
+                  f"{recall:>7} {r['mapping_error_px']:>8.3f}")
+            if r["mapping_error_px"] > 1.0:
+                failures.append(f"{resolution} {config}: box mapping off by {r['mapping_error_px']:.2f} px")
+            if trained and r["recall"] < rows["baseline"]["recall"] - args.max_recall_drop:
+                failures.append(f"{resolution} {config}: recall {r['recall']:.0%} "
+                                f"vs baseline {rows['baseline']['recall']:.0%}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    print("region detection:", "ok" if not failures else "FAILED")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import defaultdict
+
+import Levenshtein
+
+
+class PlateConsensus:
+    """Vote over several readings of one plate, weighted by per-character confidence."""
+
+    def __init__(self):
+        self.readings = []
+
+    def __len__(self):
+        return len(self.readings)
+
+    def add(self, text, confidences):
+        self.readings.append((text, list(confidences)))
+
+    def result(self):
+        """(text, confidence) of the current consensus; (None, 0.0) without readings."""
+        if not self.readings:
+            return None, 0.0
+
+        length_weight = defaultdict(float)
+        for text, confidences in self.readings:
+            length_weight[len(text)] += sum(confidences) / len(confidences) if confidences else 0.0
+        length = max(length_weight, key=length_weight.get)
+        total_weight = sum(length_weight.values())
+        if length == 0 or total_weight == 0:
+            return "", 0.0
+
+        same_length = [r for r in self.readings if len(r[0]) == length]
+        text = []
+        confidence = 1.0
+        for i in range(length):
+            scores = defaultdict(float)
+            counts = defaultdict(int)
+            for reading, confidences in same_length:
+                scores[reading[i]] += confidences[i]
+                counts[reading[i]] += 1
+            char, score = max(scores.items(), key=lambda item: item[1])
+            text.append(char)
+            share = score / sum(scores.values())
+            confidence = min(confidence, share * score / counts[char])
+        return "".join(text), confidence * length_weight[length] / total_weight
+
+
+class _Group:
+    def __init__(self, now):
+        self.consensus = PlateConsensus()
+        self.last_seen = now
+        self.plate = None
+        self.outcome = None
+        self.deciding = None  # threading.Event while decide() runs
+
+
+class ConsensusBuffer:
+    """Groups readings of the same vehicle at one gate so the gate acts once per vehicle."""
+
+    def __init__(self, threshold=0.75, window_s=30.0, max_distance=2):
+        self.threshold = threshold
+        self.window_s = window_s
+        self.max_distance = max_distance
+        self._groups = defaultdict(list)  # gate key -> groups
+        self._lock = threading.Lock()
+
+        self.decided = 0
+        self.duplicates = 0
+        self.pending = 0
+
+    def _find_group(self, groups, text, now):
+        # Both directions: backfilled batches (capture-time `now`) may be replayed out of order
+        groups[:] = [g for g in groups if abs(now - g.last_seen) <= self.window_s]
+        best, best_dist = None, self.max_distance + 1
+        for group in groups:
+            if group.plate is not None:
+                # Decided (or deciding) groups only take their own plate: a near miss may be another vehicle
+                if text == group.plate:
+                    return group
+                continue
+            dist = Levenshtein.distance(text, group.consensus.result()[0])
+            if dist < best_dist:
+                best, best_dist = group, dist
+        if best is None:
+            best = _Group(now)
+            groups.append(best)
+        return best
+
+    def _merge_into_decided(self, groups, group, plate):
+        # Noisy readings of an already decided vehicle settle on its plate: hand them to that group
+        for other in groups:
+            if other is not group and other.plate == plate:
+                for reading in group.consensus.readings:
+                    other.consensus.add(*reading)
+                other.last_seen = max(other.last_seen, group.last_seen)
+                groups.remove(group)
+                return other
+        return group
+
+    def submit(self, gate, text, confidences, decide, now=None):
+        """Add a reading; returns (status, plate, confidence, outcome), status decided / duplicate / pending."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            group = self._find_group(self._groups[gate], text, now)
+            group.last_seen = now
+            group.consensus.add(text, confidences)
+            plate, confidence = group.consensus.result()
+            if group.plate is None and plate and confidence >= self.threshold:
+                group = self._merge_into_decided(self._groups[gate], group, plate)
+                plate, confidence = group.consensus.result()
+
+            in_progress = group.deciding
+            if in_progress is None:
+                if group.outcome is not None and group.outcome[0]:
+                    self.duplicates += 1
+                    return "duplicate", group.plate, confidence, group.outcome
+                if not plate or confidence < self.threshold:
+                    self.pending += 1
+                    return "pending", plate, confidence, None
+                group.plate = plate
+                group.deciding = threading.Event()
+
+        if in_progress is not None:
+            # Another reading of this vehicle is being decided: reuse its outcome if it let the vehicle through
+            in_progress.wait()
+            with self._lock:
+                if group.outcome is not None and group.outcome[0]:
+                    self.duplicates += 1
+                    return "duplicate", group.plate, confidence, group.outcome
+                self.pending += 1
+                return "pending", plate, confidence, None
+
+        outcome = None
+        try:
+            outcome = decide(plate)
+        finally:
+            # Outcome and end of the decision in one step: a reading arriving in between would decide again
+            with self._lock:
+                if outcome is not None:
+                    group.outcome = outcome
+                    self.decided += 1
+                deciding, group.deciding = group.deciding, None
+            deciding.set()
+        return "decided", plate, confidence, outcome
+
+    def stats(self):
+        return {
+            "threshold": self.threshold,
+            "window_s": self.window_s,
+            "decided": self.decided,
+            "duplicates": self.duplicates,
+            "pending": self.pending,
+        }
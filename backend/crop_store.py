@@ -0,0 +1,137 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+
+class CropStore:
+    """Content-addressed on-disk store of plate crops, written in the background, LRU-evicted over `max_bytes`."""
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024, jpeg_quality=90):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.jpeg_quality = jpeg_quality
+        self._index = OrderedDict()   # crop id -> file size, least recently used first
+        self._pending = {}            # crop id -> crop not yet written
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="crop-writer")
+
+        self.writes = 0
+        self.hits = 0
+        self.evictions = 0
+        self.failures = 0
+
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    # Left over from a write interrupted by a crash
+                    os.remove(os.path.join(dirpath, name))
+                elif name.endswith(".jpg"):
+                    stat = os.stat(os.path.join(dirpath, name))
+                    files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, crop_id, size in sorted(files):
+            self._index[crop_id] = size
+            self._total_bytes += size
+        self._evict()
+
+    def path(self, crop_id):
+        return os.path.join(self.root, crop_id[:2], f"{crop_id}.jpg")
+
+    def encode(self, crop):
+        _, buffer = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return buffer.tobytes()
+
+    def put(self, crop):
+        """Store a crop and return its id. Returns before the file is written."""
+        digest = hashlib.blake2b(crop.tobytes(), digest_size=16)
+        digest.update(str(crop.shape).encode())
+        crop_id = digest.hexdigest()
+        with self._lock:
+            if crop_id in self._index:
+                self._index.move_to_end(crop_id)
+                self.hits += 1
+                return crop_id
+            if crop_id in self._pending:
+                return crop_id
+            # Copy: the crop is a view into the frame, which may be reused
+            self._pending[crop_id] = crop.copy()
+        self._writer.submit(self._write, crop_id)
+        return crop_id
+
+    def _write(self, crop_id):
+        path = self.path(crop_id)
+        tmp_path = f"{path}.tmp"
+        try:
+            data = self.encode(self._pending[crop_id])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Could not store crop {crop_id}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            with self._lock:
+                del self._pending[crop_id]
+                self.failures += 1
+            return
+        with self._lock:
+            del self._pending[crop_id]
+            self._index[crop_id] = len(data)
+            self._total_bytes += len(data)
+            self.writes += 1
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            crop_id, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(crop_id))
+            except FileNotFoundError:
+                pass
+
+    def get(self, crop_id):
+        """JPEG bytes of a crop, or None. Stored files are read under the lock, so eviction cannot race the read."""
+        with self._lock:
+            if crop_id in self._index:
+                try:
+                    with open(self.path(crop_id), "rb") as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    # Removed behind the store's back
+                    self._total_bytes -= self._index.pop(crop_id)
+                    return None
+                self._index.move_to_end(crop_id)
+                return data
+            crop = self._pending.get(crop_id)
+        if crop is not None:
+            return self.encode(crop)
+        return None
+
+    def shutdown(self):
+        self._writer.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            "files": len(self._index),
+            "pending": len(self._pending),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "writes": self.writes,
+            "hits": self.hits,
+            "evictions": self.evictions,
+            "failures": self.failures,
+        }
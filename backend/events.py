@@ -0,0 +1,81 @@
+import asyncio
+import datetime
+import uuid
+from collections import deque
+
+
+class Subscription:
+    """Event queue of one subscriber; gets a single "resync" instead when it falls `maxsize` behind."""
+
+    def __init__(self, maxsize):
+        self._queue = asyncio.Queue(maxsize)
+        self.lagged = 0
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged += 1
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait({"seq": event["seq"], "type": "resync", "time": event["time"], "data": {}})
+
+    async def get(self):
+        return await self._queue.get()
+
+
+class EventBus:
+    """In-process publish/subscribe of parking events, with the last `history` kept for replay. Event loop only."""
+
+    def __init__(self, history=1000, queue_size=1000):
+        # Sequence numbers restart with the process; the epoch tells clients they did
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.queue_size = queue_size
+        self._history = deque(maxlen=history)
+        # Sequence number of the newest retained event that fell out of the history
+        self._evicted = 0
+        self._subscribers = set()
+        self.published = 0
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def publish(self, event_type, retain=True, **data):
+        """Send an event to all subscribers. `retain=False` events (periodic refreshes) are not replayed."""
+        self.seq += 1
+        event = {"seq": self.seq, "type": event_type, "time": datetime.datetime.now().isoformat(), "data": data}
+        if retain:
+            if len(self._history) == self._history.maxlen:
+                self._evicted = self._history[0]["seq"]
+            self._history.append(event)
+        for subscription in self._subscribers:
+            subscription._put(event)
+        self.published += 1
+        return event
+
+    def subscribe(self):
+        subscription = Subscription(self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+
+    def since(self, seq):
+        """Retained events after `seq`, or None when some of them have already left the history."""
+        if seq > self.seq or seq < self._evicted:
+            return None
+        return [event for event in self._history if event["seq"] > seq]
+
+    def stats(self):
+        return {
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "published": self.published,
+            "subscribers": self.subscribers,
+            # Copied first: /inference/stats runs on a worker thread while the loop (un)subscribes
+            "lagged": sum(s.lagged for s in list(self._subscribers)),
+            "history": len(self._history),
+        }
@@ -0,0 +1,48 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+def decode_image(contents):
+    """Decode raw upload bytes into a BGR image."""
+    nparr = np.frombuffer(contents, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+class FrameExecutor:
+    """Decodes frames on a thread pool, with at most `max_in_flight` frames in flight (try_acquire/release)."""
+
+    def __init__(self, workers=4, max_in_flight=16):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame")
+
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self):
+        # Called only from the event loop thread, so a plain counter is enough
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,28 @@
+"""Export LPRNet weights to TorchScript and/or ONNX: python export_lprnet.py --weights ... --out-dir ..."""
+import argparse
+import os
+
+from lpr_runtime import export_onnx, export_torchscript, load_eager_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="/app/weights/lprnet_best.pth")
+    parser.add_argument("--out-dir", default="/app/weights")
+    parser.add_argument("--formats", nargs="+", choices=["torchscript", "onnx"], default=["torchscript", "onnx"])
+    args = parser.parse_args()
+
+    model = load_eager_model(args.weights, "cpu")
+    os.makedirs(args.out_dir, exist_ok=True)
+    if "torchscript" in args.formats:
+        path = os.path.join(args.out_dir, "lprnet.ts.pt")
+        export_torchscript(model, path)
+        print(f"TorchScript saved to {path}")
+    if "onnx" in args.formats:
+        path = os.path.join(args.out_dir, "lprnet.onnx")
+        export_onnx(model, path)
+        print(f"ONNX saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,219 @@
+import asyncio
 import datetime
-import Levenshtein
 import Mock.GPIO as GPIO
 import os
-from database import SessionLocal, ParkingSession
+import time
+from collections import Counter
+from dataclasses import dataclass
+from sqlalchemy import func, select, update
+from database import ArchivedBatch, ParkingSession, ParkingZone, make_writer, session_scope
+from events import EventBus
+from metrics import ENTRIES, EXITS, STAGE_SECONDS
+from plate_index import PlateIndex
+from tariff import Tariff
+from zones import CapacityEngine
 
 # Setup Mock GPIO
 BARRIER_PIN = 18
 GPIO.setmode(GPIO.BCM)
 GPIO.setup(BARRIER_PIN, GPIO.OUT)
 
+@dataclass
+class ActiveSession:
+    """Compact in-memory record of a vehicle currently on the parking."""
+    id: int
+    plate: str
+    entry_time: datetime.datetime
+    is_paid: bool = False
+    amount_due: float = 0.0
+    zone: str = "A"
+
 class ParkingSystem:
-    def __init__(self, capacity_a=20):
-        self.capacity_a = capacity_a
-        self.db = SessionLocal()
-        # Initialize capacity check from DB (count active sessions)
-        active_count = self.db.query(ParkingSession).filter(ParkingSession.exit_time == None).count()
-        self.spots_taken = active_count
+    """Parking state and gate logic. DB methods are coroutines and run on the event loop."""
+
+    def __init__(self, capacity_a=20, tariff=None, writer=None, events=None, zones=None):
+        # Zones and gates (PARKING_ZONES / PARKING_GATES); by default a single zone "A" of `capacity_a` spots
+        self.zones = zones or CapacityEngine.from_env(default_capacity=capacity_a)
+        self.tariff = tariff or Tariff.from_env()
+        # DB writes go through the writer (per-event commit or group commit, see database.make_writer).
+        # They are submitted in the same step as the cache update, so they reach the DB in event order.
+        self.writer = writer or make_writer()
+        self._lock = asyncio.Lock()
+        # Authoritative active-session map (plate -> ActiveSession) and fuzzy plate index.
+        # Loaded from DB by start(), then kept up to date write-through on entry, payment and exit.
+        self.active = {}
+        self.plate_index = PlateIndex(max_distance=2)
+        # Session ids are allocated here, so the cache is updated before the row is committed
+        self._next_id = 1
+        # Parking events (entry, payment, exit, occupancy) for push clients, published under the lock
+        # in the same step as the cache change, so they follow the order of the state they describe
+        self.events = events or EventBus()
+
+    async def start(self):
+        """Load the active sessions and start the DB writer."""
+        for record in await self._load_active_unique():
+            self._cache_add(record)
+        self.zones.reset(Counter(record.zone for record in self.active.values()))
+        self._next_id = await self._max_id() + 1
+        await self._store_zones()
+        self.writer.start()
+
+    @property
+    def spots_taken(self):
+        return self.zones.occupied
+
+    async def _store_zones(self):
+        """Write the configured zones with their occupancy recounted from the sessions in the DB."""
+        async with session_scope() as db:
+            counts = dict((await db.execute(
+                select(ParkingSession.zone, func.count()).where(ParkingSession.exit_time == None)
+                .group_by(ParkingSession.zone)
+            )).all())
+            for name, state in self.zones.zones.items():
+                await db.merge(ParkingZone(name=name, capacity=state.capacity, occupied=counts.get(name, 0)))
+
+    async def _load_active(self):
+        async with session_scope() as db:
+            rows = await db.execute(
+                select(
+                    ParkingSession.id, ParkingSession.plate, ParkingSession.entry_time,
+                    ParkingSession.is_paid, ParkingSession.amount_due, ParkingSession.zone
+                ).where(ParkingSession.exit_time == None).order_by(ParkingSession.id)
+            )
+            return [ActiveSession(*row) for row in rows]
+
+    async def _load_active_unique(self):
+        """Active sessions, one per plate; older duplicates from a legacy DB are closed in the DB."""
+        newest, superseded = {}, []
+        for record in await self._load_active():  # id order
+            previous = newest.get(record.plate)
+            if previous is not None:
+                superseded.append((previous, record))
+            newest[record.plate] = record
+        if superseded:
+            async with session_scope() as db:
+                for old, new in superseded:
+                    print(f"Duplicate active session for {old.plate}: closing {old.id}, keeping {new.id}")
+                    await db.execute(update(ParkingSession).where(ParkingSession.id == old.id)
+                                     .values({ParkingSession.exit_time: max(old.entry_time, new.entry_time)}))
+        return list(newest.values())
+
+    async def _max_id(self):
+        async with session_scope() as db:
+            # Archived sessions keep their ids, so those are never handed out again either
+            return max(await db.scalar(select(func.max(ParkingSession.id))) or 0,
+                       await db.scalar(select(func.max(ArchivedBatch.last_id))) or 0)
+
+    def _cache_add(self, record):
+        self.active[record.plate] = record
+        self.plate_index.add(record.plate, record.id)
+
+    def _cache_remove(self, record):
+        del self.active[record.plate]
+        self.plate_index.remove(record.plate, record.id)
+
+    def _update_session(self, session_id, values):
+        """Queue an update of one session row. Returns the writer's Future."""
+        async def op(db):
+            await db.execute(update(ParkingSession).where(ParkingSession.id == session_id).values(values))
+        return self.writer.submit(op)
+
+    def _close_session(self, record, at=None):
+        """Drop the session from the cache, free its spot and queue the exit time write."""
+        self._cache_remove(record)
+        self.zones.release(record.zone)
+        exit_time = at or datetime.datetime.now()
+
+        async def op(db):
+            await db.execute(update(ParkingSession).where(ParkingSession.id == record.id)
+                             .values({ParkingSession.exit_time: exit_time}))
+            # Same transaction as the exit; a zone no longer in the DB is simply not counted
+            await db.execute(update(ParkingZone).where(ParkingZone.name == record.zone, ParkingZone.occupied > 0)
+                             .values(occupied=ParkingZone.occupied - 1))
+        return self.writer.submit(op)
+
+    def _session_view(self, record, fee):
+        return {
+            "id": record.id,
+            "plate": record.plate,
+            "entry_time": record.entry_time,
+            "is_paid": record.is_paid,
+            "amount_due": record.amount_due,
+            "zone": record.zone,
+            "current_fee": float(fee),
+        }
+
+    def _occupancy(self):
+        return {
+            "occupied": self.spots_taken,
+            "free": self.zones.capacity - self.spots_taken,
+            "capacity": self.zones.capacity,
+            "zones": self.zones.snapshot(),
+        }
+
+    def _publish_occupancy(self):
+        self.events.publish("occupancy", **self._occupancy())
+
+    def snapshot(self):
+        """Full state for push clients, as of event `seq`. Call on the event loop."""
+        return {
+            "seq": self.events.seq,
+            "type": "snapshot",
+            "time": datetime.datetime.now().isoformat(),
+            "data": {"sessions": self.active_fees(), **self._occupancy()},
+        }
+
+    def publish_fees(self):
+        """Publish the current fees of all active sessions (they grow with time, not with events)."""
+        records = list(self.active.values())
+        fees = self.tariff.fees([record.entry_time for record in records])
+        self.events.publish("fees", retain=False, fees={record.id: float(fee) for record, fee in zip(records, fees)})
+
+    async def _wait(self, write):
+        """Wait for a queued write to commit outside the lock; False if it failed (cache reconciled)."""
+        if self.writer.mode == "async":
+            return True
+        try:
+            # Shielded: a cancelled request must not cancel a write that is already queued
+            await asyncio.shield(write)
+            return True
+        except Exception as e:
+            print(f"DB write failed, reconciling cache: {e}")
+            await self.reconcile()
+            return False
+
+    async def close(self):
+        """Commit queued writes and stop the writer."""
+        await self.writer.close()
+
+    async def reconcile(self):
+        """Repair the in-memory active sessions from the DB."""
+        async with self._lock:
+            # Queued writes are part of the state the cache already reflects
+            await self.writer.flush()
+            db_records = {record.plate: record for record in await self._load_active_unique()}
+            self._next_id = max(self._next_id, await self._max_id() + 1)
+            missing = [plate for plate in db_records if plate not in self.active]
+            stale = [plate for plate in self.active if plate not in db_records]
+            changed = [plate for plate, record in db_records.items()
+                       if plate in self.active and self.active[plate] != record]
+
+            for plate in stale + changed:
+                self._cache_remove(self.active[plate])
+            for plate in missing + changed:
+                self._cache_add(db_records[plate])
+            self.zones.reset(Counter(record.zone for record in self.active.values()))
+            await self._store_zones()
+            if missing or stale or changed:
+                # Clients reload the full state
+                self.events.publish("resync")
+
+            return {"missing": missing, "stale": stale, "changed": changed, "active": len(self.active)}
 
     @property
     def free_spots(self):
-        # We return a dict to match original interface for now, or just logic
-        # Original used self.free_spots['A'], let's keeping it compatible or dynamic
-        return {'A': self.capacity_a - self.spots_taken}
+        """Free spots per zone, e.g. {'A': 12}."""
+        return {name: state.free for name, state in self.zones.zones.items()}
 
     def open_gate(self):
         """Simulate opening the gate via GPIO."""
@@ -32,87 +224,143 @@ class ParkingSystem:
         # Let's toggle back to LOW to simulate a pulse if needed, or just leave HIGH ("Open")
         # For this demo, let's assume HIGH = Open command sent.
 
-    def process_entry(self, plate, zone='A'):
-        if self.free_spots['A'] > 0:
+    async def process_entry(self, plate, zone=None, image_path=None, gate=None, at=None):
+        """Admit `plate` into `zone` (default: the zone of `gate`) at time `at` if it has a free spot."""
+        try:
+            zone = self.zones.resolve(zone, gate)
+        except KeyError:
+            return False, "Nieznana strefa"
+        async with self._lock:
             # Check if car is already inside (safety check logic)
-            active_session = self.db.query(ParkingSession).filter(
-                ParkingSession.plate == plate, 
-                ParkingSession.exit_time == None
-            ).first()
-
-            if not active_session:
-                new_session = ParkingSession(plate=plate)
-                self.db.add(new_session)
-                self.db.commit()
-                self.spots_taken += 1
-                
-                self.open_gate()
-                return True, "Wjazd dozwolony"
-            
-            return True, "Pojazd już na parkingu"
-        return False, "Brak miejsc"
+            if plate in self.active:
+                ENTRIES.labels(result="inside").inc()
+                return True, "Pojazd już na parkingu"
+            if not self.zones.reserve(zone):
+                ENTRIES.labels(result="full").inc()
+                return False, f"Brak miejsc w strefie {zone}"
+
+            record = ActiveSession(self._next_id, plate, at or datetime.datetime.now(), zone=zone)
+            self._next_id += 1
+            self._cache_add(record)
+            self.events.publish("entry", session=self._session_view(record, self.tariff.fee(record.entry_time)))
+            self._publish_occupancy()
+
+            async def op(db):
+                # Conditional increment: the DB refuses to over-admit even if another process shares it
+                taken = await db.execute(
+                    update(ParkingZone).where(ParkingZone.name == zone, ParkingZone.occupied < ParkingZone.capacity)
+                    .values(occupied=ParkingZone.occupied + 1)
+                )
+                if taken.rowcount != 1:
+                    raise RuntimeError(f"Zone {zone} is full in the DB")
+                # updated_at is the time of the write, not the (possibly backfilled) entry time,
+                # so /logs delta clients see entries replayed from the past
+                db.add(ParkingSession(
+                    id=record.id, plate=plate, entry_time=record.entry_time,
+                    updated_at=datetime.datetime.now(), image_path=image_path, zone=zone,
+                ))
+            write = self.writer.submit(op)
+
+        # The gate opens only once the session is recorded (except in async mode)
+        if not await self._wait(write):
+            ENTRIES.labels(result="error").inc()
+            return False, "Błąd zapisu - spróbuj ponownie"
+        ENTRIES.labels(result="allowed").inc()
+        self.open_gate()
+        return True, "Wjazd dozwolony"
 
     def calculate_current_fee(self, entry_time):
-        """Calculate fee: 2 PLN per started hour."""
-        now = datetime.datetime.now()
-        duration = now - entry_time
-        hours = duration.total_seconds() / 3600
-        import math
-        billable_hours = math.ceil(hours)
-        if billable_hours < 1: billable_hours = 1 # Minimum 1 hour
-        return billable_hours * 2.0
-
-    def process_exit(self, plate):
-        # Fuzzy search for active sessions
-        active_sessions = self.db.query(ParkingSession).filter(ParkingSession.exit_time == None).all()
-        
-        found_session = None
-        best_dist = 3 # threshold
-        
-        for sess in active_sessions:
-            dist = Levenshtein.distance(plate, sess.plate)
-            if dist <= 2 and dist < best_dist:
-                found_session = sess
-                best_dist = dist
-        
-        if found_session:
-            # Check if paid
-            if not found_session.is_paid:
-                current_fee = self.calculate_current_fee(found_session.entry_time)
-                return False, f"Brak opłaty! Należność: {current_fee} PLN. Proszę opłacić w kasie."
-
-            # If paid, allow exit
-            found_session.exit_time = datetime.datetime.now()
-            self.db.commit()
-            
-            self.spots_taken -= 1
-            self.open_gate()
-            
-            return True, f"Dziękujemy {found_session.plate}. Szerokiej drogi!"
-            
-        return False, "Bilet nieznaleziony"
+        """Calculate the current fee of a single session with the configured tariff."""
+        return self.tariff.fee(entry_time)
+
+    def active_fees(self):
+        """Current fees of all active sessions, computed in one vectorized pass. Call on the event loop."""
+        records = list(self.active.values())
+        fees = self.tariff.fees([record.entry_time for record in records])
+        return [self._session_view(record, fee) for record, fee in zip(records, fees)]
+
+    async def pay(self, plate):
+        """Mark the active session of `plate` as paid. Returns the fee or None if not parked."""
+        async with self._lock:
+            record = self.active.get(plate)
+            if not record:
+                return None
+
+            # Calculate fee dynamically
+            fee = self.calculate_current_fee(record.entry_time)
+            record.is_paid = True
+            record.amount_due = fee
+            write = self._update_session(record.id, {ParkingSession.is_paid: True, ParkingSession.amount_due: fee})
+            self.events.publish("payment", id=record.id, plate=plate, amount=fee)
+
+        if not await self._wait(write):
+            raise RuntimeError(f"Payment for {plate} could not be recorded")
+        return fee
+
+    async def process_exit(self, plate, at=None):
+        """Let the vehicle out at time `at` if its session is paid."""
+        async with self._lock:
+            # Fuzzy search for active sessions (edit distance <= 2) through the in-memory index
+            found_session = None
+            start = time.perf_counter()
+            match = self.plate_index.best_match(plate)
+            while match and match[0] not in self.active:
+                # An index entry without a cached session must not block every later exit of the plate
+                print(f"Dropping stale plate index entry {match[0]} (session {match[1]})")
+                self.plate_index.remove(match[0], match[1])
+                match = self.plate_index.best_match(plate)
+            STAGE_SECONDS.labels(stage="match").observe(time.perf_counter() - start)
+            if match:
+                found_session = self.active[match[0]]
+
+            if found_session:
+                if at is not None and at < found_session.entry_time:
+                    EXITS.labels(result="before_entry").inc()
+                    return False, (f"Wyjazd z {at:%Y-%m-%d %H:%M:%S} sprzed wjazdu aktywnej sesji "
+                                   f"({found_session.entry_time:%Y-%m-%d %H:%M:%S}) - pominięty")
+
+                # Check if paid
+                if not found_session.is_paid:
+                    current_fee = self.tariff.fee(found_session.entry_time, at)
+                    EXITS.labels(result="unpaid").inc()
+                    return False, f"Brak opłaty! Należność: {current_fee} PLN. Proszę opłacić w kasie."
+
+                # If paid, allow exit
+                write = self._close_session(found_session, at)
+                self.events.publish("exit", id=found_session.id, plate=found_session.plate)
+                self._publish_occupancy()
+            else:
+                EXITS.labels(result="not_found").inc()
+                return False, "Bilet nieznaleziony"
+
+        if not await self._wait(write):
+            EXITS.labels(result="error").inc()
+            return False, "Błąd zapisu - spróbuj ponownie"
+        EXITS.labels(result="allowed").inc()
+        self.open_gate()
+        return True, f"Dziękujemy {found_session.plate}. Szerokiej drogi!"
 
     def manual_open(self):
         self.open_gate()
         return "Barrier manual open triggered"
 
-    def force_exit(self, plate):
-        """Forcefully release a vehicle (Admin/Super Parking)."""
-        session = self.db.query(ParkingSession).filter(
-            ParkingSession.plate == plate, 
-            ParkingSession.exit_time == None
-        ).first()
+    async def force_exit(self, plate):
+        """Forcefully release a vehicle (Admin/Super Parking). Returns (ok, message)."""
+        async with self._lock:
+            session = self.active.get(plate)
 
-        if session:
-            session.exit_time = datetime.datetime.now()
+            if not session:
+                return False, "Nie znaleziono pojazdu na parkingu."
             # Mark as processed/released by admin, payment status unchanged (or set to True if policy requires)
             # For "Wypuść" we assume simply clearing it from active list.
-            self.db.commit()
-            self.spots_taken -= 1
-            self.open_gate()
-            return f"Wymuszono wyjazd dla {plate}. Bramka otwarta."
-        
-        return "Nie znaleziono pojazdu na parkingu."
+            write = self._close_session(session)
+            self.events.publish("force_exit", id=session.id, plate=plate)
+            self._publish_occupancy()
+
+        if not await self._wait(write):
+            return False, "Błąd zapisu - spróbuj ponownie"
+        self.open_gate()
+        return True, f"Wymuszono wyjazd dla {plate}. Bramka otwarta."
 
     def emergency_evacuation(self):
         self.open_gate()
@@ -0,0 +1,91 @@
+import torch
+
+from lprnet_arch import LPRNet, CHARS
+
+INPUT_SHAPE = (1, 3, 24, 94)
+
+
+def load_eager_model(weights, device):
+    model = LPRNet(len(CHARS)).to(device)
+    model.load_state_dict(torch.load(weights, map_location=device))
+    model.eval()
+    return model
+
+
+class EagerLPR:
+    """Plain PyTorch LPRNet."""
+    name = "eager"
+
+    def __init__(self, weights, device):
+        self.device = device
+        self.model = load_eager_model(weights, device)
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.model(batch)
+
+
+class TorchScriptLPR:
+    """Frozen TorchScript module produced by `export_torchscript`."""
+    name = "torchscript"
+
+    def __init__(self, path, device):
+        self.device = device
+        self.model = torch.jit.load(path, map_location=device)
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.model(batch)
+
+
+class OnnxLPR:
+    """ONNX Runtime session on CPU, produced by `export_onnx`."""
+    name = "onnx"
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        logits = self.session.run(None, {self.input_name: batch.cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+def export_torchscript(model, path):
+    """Trace and freeze LPRNet. The traced graph accepts any batch size."""
+    model = model.cpu().eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, torch.zeros(INPUT_SHAPE))
+        frozen = torch.jit.freeze(traced)
+    frozen.save(path)
+
+
+def export_onnx(model, path, opset=17):
+    """Export LPRNet to ONNX with a dynamic batch dimension."""
+    model = model.cpu().eval()
+    torch.onnx.export(
+        model, torch.zeros(INPUT_SHAPE), path,
+        input_names=["input"], output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset, dynamo=False,
+    )
+
+
+def load_lpr(backend, device, weights, torchscript_path=None, onnx_path=None, threads=None):
+    """Create the LPRNet runtime selected by `backend` (eager / torchscript / onnx)."""
+    if threads and backend != "onnx":
+        torch.set_num_threads(threads)
+    if backend == "eager":
+        return EagerLPR(weights, device)
+    if backend == "torchscript":
+        return TorchScriptLPR(torchscript_path, device)
+    if backend == "onnx":
+        return OnnxLPR(onnx_path, threads=threads)
+    raise ValueError(f"Unknown LPR backend: {backend}")
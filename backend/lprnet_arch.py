@@ -1,3 +1,7 @@
+import threading
+
+import cv2
+import numpy as np
 import torch
 import torch.nn as nn
 
@@ -17,55 +21,123 @@ class SmallBasicBlock(nn.Module):
         )
     def forward(self, x): return self.block(x)
 
+class ChannelMaxPool(nn.MaxPool3d):
+    """nn.MaxPool3d over (C, H, W) of an NCHW tensor, through a 5D view so it exports to ONNX."""
+    def forward(self, x):
+        return super().forward(x.unsqueeze(1)).squeeze(1)
+
 class LPRNet(nn.Module):
     def __init__(self, class_num=37, dropout_rate=0.5):
         super(LPRNet, self).__init__()
         self.class_num = class_num
         self.backbone = nn.Sequential(
             nn.Conv2d(3, 64, 3), nn.BatchNorm2d(64), nn.ReLU(),
-            nn.MaxPool3d((1, 3, 3), stride=(1, 1, 1)),
+            ChannelMaxPool((1, 3, 3), stride=(1, 1, 1)),
             SmallBasicBlock(64, 128), nn.BatchNorm2d(128), nn.ReLU(),
-            nn.MaxPool3d((1, 3, 3), stride=(2, 1, 2)),
+            ChannelMaxPool((1, 3, 3), stride=(2, 1, 2)),
             SmallBasicBlock(64, 256), nn.BatchNorm2d(256), nn.ReLU(),
             SmallBasicBlock(256, 256), nn.BatchNorm2d(256), nn.ReLU(),
-            nn.MaxPool3d((1, 3, 3), stride=(4, 1, 2)),
+            ChannelMaxPool((1, 3, 3), stride=(4, 1, 2)),
             nn.Dropout(dropout_rate),
             nn.Conv2d(64, 256, (1, 4)), nn.BatchNorm2d(256), nn.ReLU(),
             nn.Dropout(dropout_rate),
             nn.Conv2d(256, class_num, (13, 1)), nn.BatchNorm2d(class_num), nn.ReLU()
         )
         self.container = nn.Conv2d(448 + class_num, class_num, kernel_size=(1, 1))
+        # Global-context pooling, created once (no parameters, so the state_dict is unchanged)
+        self.context_pools = nn.ModuleList([
+            nn.AvgPool2d(5, 5), nn.AvgPool2d(5, 5), nn.AvgPool2d((4, 10), (4, 2)), nn.Identity()
+        ])
+
+    # Backbone outputs used as global-context features
+    KEEP_FEATURES = (2, 6, 13, 22)
 
     def forward(self, x):
         keep_features = []
-        for i, layer in enumerate(self.backbone.children()):
+        for i, layer in enumerate(self.backbone):
             x = layer(x)
-            if i in [2, 6, 13, 22]: keep_features.append(x)
+            if i in self.KEEP_FEATURES: keep_features.append(x)
         global_context = []
-        for i, f in enumerate(keep_features):
-            if i in [0, 1]: f = nn.AvgPool2d(5, 5)(f)
-            if i == 2: f = nn.AvgPool2d((4, 10), (4, 2))(f)
+        for pool, f in zip(self.context_pools, keep_features):
+            f = pool(f)
             f_pow = torch.pow(f, 2)
-            f_mean = torch.mean(f_pow)
+            # Per-sample mean, so plates stacked in one batch do not influence each other
+            f_mean = torch.mean(f_pow, dim=(1, 2, 3), keepdim=True)
             global_context.append(torch.div(f, f_mean))
         x = torch.cat(global_context, 1)
         x = self.container(x)
         logits = torch.mean(x, dim=2)
         return logits
 
-def decode_lpr(logits):
-    """Dekodowanie CTC (Greedy Decode) - Zgodne z kodem użytkownika"""
+PLATE_SIZE = (94, 24)
+# (x - 127.5) * 0.0078125 == x * 0.0078125 - 0.99609375, dokładnie w float32
+NORM_SCALE = np.float32(0.0078125)
+NORM_OFFSET = np.float32(127.5 * 0.0078125)
+
+def _fill_plates(crops, resized, out):
+    """Resize wycinków do `resized` (uint8 NHWC) i normalizacja do `out` (float32 NCHW) w jednym przebiegu."""
+    for crop, dst in zip(crops, resized):
+        cv2.resize(crop, PLATE_SIZE, dst=dst)
+    np.multiply(resized.transpose(0, 3, 1, 2), NORM_SCALE, out=out, dtype=np.float32)
+    np.subtract(out, NORM_OFFSET, out=out)
+
+def preprocess_plates(crops, device):
+    """Przygotowanie wycinków tablic jako jeden tensor wsadowy [N, 3, 24, 94] (nowy tensor przy każdym wywołaniu)."""
+    resized = np.empty((len(crops), PLATE_SIZE[1], PLATE_SIZE[0], 3), dtype=np.uint8)
+    out = np.empty((len(crops), 3, PLATE_SIZE[1], PLATE_SIZE[0]), dtype=np.float32)
+    _fill_plates(crops, resized, out)
+    return torch.from_numpy(out).to(device)
+
+class PlatePreprocessor:
+    """preprocess_plates na buforach wielokrotnego użytku osobnych dla wątku; wynik ważny do następnego wywołania."""
+
+    def __init__(self, capacity=8):
+        self.capacity = capacity
+        self._local = threading.local()
+
+    def _buffers(self, n, pin):
+        local = self._local
+        if getattr(local, "capacity", 0) < n or local.pinned != pin:
+            capacity = max(self.capacity, 1 << (n - 1).bit_length())
+            local.resized = np.empty((capacity, PLATE_SIZE[1], PLATE_SIZE[0], 3), dtype=np.uint8)
+            local.tensor = torch.empty((capacity, 3, PLATE_SIZE[1], PLATE_SIZE[0]), dtype=torch.float32, pin_memory=pin)
+            local.array = local.tensor.numpy()
+            local.capacity, local.pinned = capacity, pin
+        return local.resized[:n], local.array[:n], local.tensor[:n]
+
+    def __call__(self, crops, device):
+        device = torch.device(device)
+        resized, out, tensor = self._buffers(len(crops), device.type == "cuda")
+        _fill_plates(crops, resized, out)
+        if device.type == "cpu":
+            return tensor
+        return tensor.to(device, non_blocking=True)
+
+def decode_lpr(logits, return_confidence=False):
+    """Dekodowanie CTC (Greedy Decode) wsadu; z `return_confidence` pary (tekst, pewności znaków)."""
     # Logits shape: [Batch, ClassNum, Width]
-    # Softmax over ClassNum (dim=1)
+    # Softmax over ClassNum (dim=1), best class and its probability for each step
     probs = torch.softmax(logits, dim=1)
-    # Argmax over ClassNum to get best class for each step
-    max_indices = torch.argmax(probs, dim=1)[0].cpu().numpy()
-    
+    max_probs, max_indices = torch.max(probs, dim=1)
+    max_probs = max_probs.cpu().numpy()
+    max_indices = max_indices.cpu().numpy()
+
     blank_idx = len(CHARS) - 1
-    res = []
-    prev_idx = -1
-    for idx in max_indices:
-        if idx != prev_idx and idx != blank_idx:
-            res.append(CHARS[idx])
-        prev_idx = idx
-    return "".join(res)
\ No newline at end of file
+    # Collapse repeats and drop blanks for every sequence in the batch at once
+    prev_indices = np.full_like(max_indices, -1)
+    prev_indices[:, 1:] = max_indices[:, :-1]
+    run_starts = max_indices != prev_indices
+    keep = run_starts & (max_indices != blank_idx)
+
+    chars = np.asarray(CHARS)
+    texts = ["".join(chars[row[mask]]) for row, mask in zip(max_indices, keep)]
+    if not return_confidence:
+        return texts
+
+    results = []
+    for text, row_probs, row_starts, row_keep in zip(texts, max_probs, run_starts, keep):
+        # Max probability over each run of identical steps, kept only for non-blank runs
+        starts = np.flatnonzero(row_starts)
+        run_conf = np.maximum.reduceat(row_probs, starts)
+        results.append((text, run_conf[row_keep[starts]].tolist()))
+    return results
@@ -1,90 +1,519 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from ultralytics import YOLO
-import torch
-import cv2
-import numpy as np
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Header, Depends
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 import base64
-import io
-from datetime import datetime
-from sqlalchemy.orm import Session
+import concurrent.futures
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-from lprnet_arch import LPRNet, CHARS, decode_lpr
 from logic import ParkingSystem
-from database import init_db, SessionLocal, ParkingSession
+from models import ModelRegistry
+from database import init_db, get_db, ParkingSession
+from scheduler import InferenceScheduler
+from executor import FrameExecutor, decode_image
+from stream import StreamManager
+from consensus import ConsensusBuffer
+from crop_store import CropStore
+from batch import frames_from_archive, frames_from_uploads, order_by_capture, parse_metadata
+from profiler import RequestProfiler
+from roi import DetectionRegions
+from archive import Archiver, SessionArchive, query_history, summarize_history
+import metrics
+from metrics import STAGE_SECONDS
 
 app = FastAPI(title="Parking Intelligence System API")
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
-# Inicjalizacja bazy danych przy starcie
-try:
-    init_db()
-    print("Database initialized.")
-except Exception as e:
-    print(f"Error initializing DB: {e}")
-
-# Wczytanie modeli AI
-try:
-    print(f"Loading models on {DEVICE}...")
-    yolo = YOLO("/app/weights/best.pt")
-    
-    lpr = LPRNet(len(CHARS)).to(DEVICE)
-    lpr.load_state_dict(torch.load("/app/weights/lprnet_best.pth", map_location=DEVICE))
-    lpr.eval()
-    print("Models loaded successfully.")
-except Exception as e:
-    print(f"CRITICAL ERROR loading models: {e}")
+STARTED_AT = time.monotonic()
+# Backend LPRNet: eager / torchscript / onnx (modele eksportowane przez export_lprnet.py)
+LPR_BACKEND = os.environ.get("LPR_BACKEND", "eager")
+LPR_THREADS = int(os.environ.get("LPR_THREADS", 0)) or None
+# Precyzja inferencji: fp32 albo int8 (modele skwantyzowane przez quantize_models.py, ONNX Runtime na CPU)
+INFERENCE_PRECISION = os.environ.get("INFERENCE_PRECISION", "fp32")
+if INFERENCE_PRECISION == "int8":
+    # Modele int8 istnieją tylko w ONNX - jawnie wybrany inny backend to błąd konfiguracji
+    if os.environ.get("LPR_BACKEND", "onnx") != "onnx":
+        raise ValueError(f"INFERENCE_PRECISION=int8 requires LPR_BACKEND=onnx (got {LPR_BACKEND})")
+    LPR_BACKEND = "onnx"
+    YOLO_WEIGHTS = "/app/weights/best.int8.onnx"
+    LPR_ONNX_PATH = "/app/weights/lprnet.int8.onnx"
+else:
+    YOLO_WEIGHTS = "/app/weights/best.pt"
+    LPR_ONNX_PATH = "/app/weights/lprnet.onnx"
+
+# Modele AI wczytywane równolegle w tle przy starcie (z rozgrzewką) - patrz /health/ready
+models = ModelRegistry(
+    YOLO_WEIGHTS, LPR_BACKEND,
+    lpr_weights="/app/weights/lprnet_best.pth",
+    torchscript_path="/app/weights/lprnet.ts.pt",
+    onnx_path=LPR_ONNX_PATH,
+    lpr_threads=LPR_THREADS,
+)
+db_ready = False
 
 parking = ParkingSystem()
 
+# Obszary zainteresowania kamer (CAMERA_ROIS albo wyuczone z wykryć) i rozmiar wejścia detektora (INFERENCE_SIZE)
+regions = DetectionRegions.from_env()
+
+def run_inference(frames):
+    """Wsadowe rozpoznawanie klatek (obraz, id kamery) - dla każdej lista (box, crop, plate_text, pewności)."""
+    # Import odroczony - lprnet_arch ładuje torch, który nie jest potrzebny do startu API
+    from lprnet_arch import decode_lpr
+
+    if not models.ready:
+        raise RuntimeError("Modele AI nie są wczytane")
+    with STAGE_SECONDS.labels(stage="region").time():
+        prepared = [regions.prepare(img, camera_id) for img, camera_id in frames]
+
+    # Ramki tablic w pikselach pełnej klatki
+    frame_boxes = [[] for _ in frames]
+    with STAGE_SECONDS.labels(stage="detect").time():
+        by_size = defaultdict(list)
+        for frame_idx, (_, plan) in enumerate(prepared):
+            by_size[plan.imgsz].append(frame_idx)
+        for imgsz, indices in by_size.items():
+            results = models.yolo([prepared[i][0] for i in indices], imgsz=imgsz)
+            for frame_idx, res in zip(indices, results):
+                plan = prepared[frame_idx][1]
+                for box in res.boxes:
+                    cls_id = int(box.cls[0])
+                    if cls_id != 0: continue # Interesują nas tylko tablice
+                    frame_boxes[frame_idx].append([int(v) for v in plan.to_frame([float(v) for v in box.xyxy[0]])])
+
+    # Zbieramy wszystkie wycinki tablic ze wszystkich klatek
+    crop_start = time.perf_counter()
+    crops = []
+    owners = []
+    for frame_idx, ((img, camera_id), boxes) in enumerate(zip(frames, frame_boxes)):
+        regions.learn(camera_id, boxes, img.shape)
+        for x1, y1, x2, y2 in boxes:
+            # Cropowanie z zabezpieczeniem krawędzi
+            crop = img[max(0, y1):min(img.shape[0], y2), max(0, x1):min(img.shape[1], x2)]
+
+            if crop.size > 0:
+                crops.append(crop)
+                owners.append((frame_idx, [x1, y1, x2, y2]))
+
+    per_frame = [[] for _ in frames]
+    if crops:
+        # Jeden tensor [N, 3, 24, 94] (w buforze wielokrotnego użytku) i jeden forward LPRNet
+        batch = models.preprocess(crops, models.device)
+        STAGE_SECONDS.labels(stage="crop").observe(time.perf_counter() - crop_start)
+        with STAGE_SECONDS.labels(stage="recognize").time():
+            logits = models.lpr(batch)
+        with STAGE_SECONDS.labels(stage="decode_lpr").time():
+            readings = decode_lpr(logits, return_confidence=True)
+        metrics.DETECTIONS.inc(len(readings))
+
+        for (frame_idx, box), crop, (plate_text, confidences) in zip(owners, crops, readings):
+            per_frame[frame_idx].append((box, crop, plate_text, confidences))
+    return per_frame
+
+scheduler = InferenceScheduler(
+    run_inference,
+    max_batch_size=int(os.environ.get("INFERENCE_MAX_BATCH", 8)),
+    max_wait_ms=float(os.environ.get("INFERENCE_MAX_WAIT_MS", 10)),
+)
+
+# Dekodowanie/kodowanie obrazów poza pętlą zdarzeń, z limitem klatek w obróbce
+frame_executor = FrameExecutor(
+    workers=int(os.environ.get("FRAME_WORKERS", 4)),
+    max_in_flight=int(os.environ.get("MAX_IN_FLIGHT", 16)),
+)
+INFERENCE_MAX_QUEUE = int(os.environ.get("INFERENCE_MAX_QUEUE", 32))
+
+# Wycinki tablic zapisywane w tle do magazynu adresowanego treścią (odpowiedź zawiera tylko odnośnik)
+crop_store = CropStore(
+    os.environ.get("CROP_STORE_DIR", "/app/data/crops"),
+    max_bytes=int(os.environ.get("CROP_STORE_MAX_MB", 512)) * 1024 * 1024,
+)
+
+# Głosowanie odczytów tego samego pojazdu z kolejnych klatek - bramka działa raz, po osiągnięciu progu pewności
+consensus = ConsensusBuffer(
+    threshold=float(os.environ.get("CONSENSUS_THRESHOLD", 0.75)),
+    window_s=float(os.environ.get("CONSENSUS_WINDOW_S", 30)),
+)
+
+# Wskaźniki odczytywane w chwili pobrania /metrics
+for zone_state in parking.zones.zones.values():
+    metrics.OCCUPANCY.labels(zone=zone_state.name).set_function(lambda z=zone_state: z.occupied)
+    metrics.CAPACITY.labels(zone=zone_state.name).set_function(lambda z=zone_state: z.capacity)
+metrics.INFERENCE_QUEUE.set_function(lambda: scheduler.queue_depth)
+metrics.FRAMES_IN_FLIGHT.set_function(lambda: frame_executor.in_flight)
+metrics.DB_QUEUE.set_function(lambda: parking.writer.stats()["queued"])
+metrics.EVENT_SUBSCRIBERS.set_function(lambda: parking.events.subscribers)
+
+# Strumień zdarzeń (/events): podtrzymanie połączenia i okres odświeżania bieżących opłat
+EVENTS_KEEPALIVE_S = float(os.environ.get("EVENTS_KEEPALIVE_S", 15))
+FEES_EVENT_INTERVAL_S = float(os.environ.get("FEES_EVENT_INTERVAL_S", 30))
+
+# /logs updated_since: updated_at jest ustawiany przed zatwierdzeniem, więc server_time jest cofany o ten zapas
+LOGS_DELTA_MARGIN_S = float(os.environ.get("LOGS_DELTA_MARGIN_S", 2.0))
+
+# Wsady (/process_batch) zajmują najwyżej 2 * BATCH_CHUNK * BATCH_MAX_CONCURRENT miejsc w kolejce inferencji
+BATCH_CHUNK = int(os.environ.get("BATCH_CHUNK", 8))
+BATCH_MAX_FRAMES = int(os.environ.get("BATCH_MAX_FRAMES", 20000))
+BATCH_MAX_CONCURRENT = int(os.environ.get("BATCH_MAX_CONCURRENT", 1))
+batch_slots = asyncio.Semaphore(BATCH_MAX_CONCURRENT)
+
+# Archiwum historii: zamknięte sesje starsze niż ARCHIVE_AFTER_DAYS (0 = wyłączone) przenoszone co
+# ARCHIVE_INTERVAL_S do miesięcznych plików SQLite, żeby tabela parking_sessions pozostała mała
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 90))
+ARCHIVE_INTERVAL_S = float(os.environ.get("ARCHIVE_INTERVAL_S", 3600))
+archiver = Archiver(
+    SessionArchive(os.environ.get("ARCHIVE_DIR", "/app/data/archive")),
+    parking.writer,
+    after_days=ARCHIVE_AFTER_DAYS,
+    batch_size=int(os.environ.get("ARCHIVE_BATCH", 2000)),
+)
+
+# Profiler próbkujący włączany w locie dla kolejnych żądań /process_frame (POST /debug/profile)
+request_profiler = RequestProfiler(keep=int(os.environ.get("PROFILE_KEEP", 10)))
+
+event_loop = None
+# Limit czekania wątku roboczego na korutynę w pętli zdarzeń (run_on_loop)
+RUN_ON_LOOP_TIMEOUT_S = float(os.environ.get("RUN_ON_LOOP_TIMEOUT_S", 30))
+
+@app.on_event("startup")
+async def start_scheduler():
+    global event_loop, db_ready
+    event_loop = asyncio.get_running_loop()
+    print(f"Loading models in background ({INFERENCE_PRECISION}, LPRNet backend: {LPR_BACKEND})...")
+    models.start()
+    # Inicjalizacja bazy danych przy starcie
+    try:
+        await init_db()
+        await parking.start()
+        db_ready = True
+        print("Database initialized.")
+    except Exception as e:
+        print(f"Error initializing DB: {e}")
+    await scheduler.start()
+    app.state.fees_task = asyncio.create_task(publish_fees_periodically())
+    app.state.archive_task = asyncio.create_task(archive_periodically()) if ARCHIVE_AFTER_DAYS > 0 else None
+
+async def publish_fees_periodically():
+    """Opłaty rosną z czasem, nie ze zdarzeniami - co jakiś czas wysyłamy je klientom strumienia."""
+    while True:
+        await asyncio.sleep(FEES_EVENT_INTERVAL_S)
+        if parking.events.subscribers:
+            parking.publish_fees()
+
+async def archive_periodically():
+    """Przenoszenie starych sesji do archiwum w tle (pierwszy przebieg zaraz po starcie)."""
+    while True:
+        if db_ready:
+            try:
+                await archiver.run()
+            except Exception as e:
+                print(f"Archiving failed: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_S)
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    app.state.fees_task.cancel()
+    if app.state.archive_task:
+        app.state.archive_task.cancel()
+    # Poza pętlą: kończące się wątki kamer zgłaszają ostatnie tablice przez run_on_loop
+    await run_in_threadpool(streams.stop_all)
+    await scheduler.stop()
+    frame_executor.shutdown()
+    crop_store.shutdown()
+    # Zatwierdzenie zapisów czekających w kolejce (tryb group/async)
+    await parking.close()
+
+def require_db():
+    # Bez bazy zapisy trafiają do niewystartowanego writera i nigdy się nie kończą
+    if not db_ready:
+        raise HTTPException(status_code=503, detail="Baza danych nie jest gotowa", headers={"Retry-After": "5"})
+
 @app.get("/")
 def health_check():
-    return {"status": "ok", "message": "Backend is running"}
+    ready = models.ready and db_ready
+    return {"status": "ok" if ready else ("degraded" if models.failed else "starting"),
+            "message": "Backend is running", "ready": ready}
+
+@app.get("/health/live")
+def health_live():
+    """Proces działa i obsługuje żądania (nie sprawdza modeli ani bazy)."""
+    return {"status": "alive", "uptime_s": round(time.monotonic() - STARTED_AT, 3)}
+
+@app.get("/health/ready")
+def health_ready(response: Response):
+    """Gotowość do obsługi klatek: modele wczytane i rozgrzane, baza zainicjalizowana. 503 do tego czasu."""
+    ready = models.ready and db_ready
+    if not ready:
+        response.status_code = 503
+    status = "failed" if models.failed else ("ready" if ready else "starting")
+    return {"status": status, "database": db_ready, **models.stats()}
 
 # --- ENDPOINTY ZARZĄDZANIA ---
 
-@app.get("/logs")
-def get_logs():
-    """Zwraca całą bazę danych (historię sesji)."""
-    db = SessionLocal()
+@app.get("/inference/stats")
+def inference_stats():
+    """Metryki schedulera inferencji (głębokość kolejki, rozmiary wsadów) i puli klatek."""
+    return {**scheduler.stats(), "frame_executor": frame_executor.stats(), "consensus": consensus.stats(),
+            "crop_store": crop_store.stats(), "models": models.stats(), "regions": regions.stats(),
+            "events": parking.events.stats()}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Metryki w formacie Prometheus: histogramy czasu etapów, liczniki wykryć/wjazdów/wyjazdów, zajętość, kolejki."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.post("/debug/profile")
+def arm_profiler(data: dict = None):
+    """Admin: profiler dla kolejnych `requests` klatek (opcjonalnie interval_ms, include_idle)."""
+    data = data or {}
+    request_profiler.arm(
+        requests=int(data.get("requests", 1)),
+        interval_ms=float(data.get("interval_ms", 5)),
+        include_idle=bool(data.get("include_idle", False)),
+    )
+    return {"status": "ok", **request_profiler.stats()}
+
+@app.get("/debug/profile")
+def list_profiles():
+    """Ostatnie profile (bez stosów)."""
+    return request_profiler.stats()
+
+@app.get("/debug/profile/{profile_id}", response_class=PlainTextResponse)
+def get_profile(profile_id: int):
+    """Profil w formacie folded stacks (flamegraph.pl, speedscope)."""
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Nie znaleziono profilu")
+    return profile["folded"]
+
+@app.get("/regions")
+def detection_regions():
+    """Obszary zainteresowania kamer (skonfigurowane i wyuczone z wykryć) i rozmiary wejścia detektora."""
+    return regions.stats()
+
+@app.put("/regions/{camera_id}")
+def set_detection_region(camera_id: str, data: dict):
+    """Admin: obszar kamery [x1, y1, x2, y2] w ułamkach klatki; `roi: null` przywraca wyuczony."""
     try:
-        logs = db.query(ParkingSession).order_by(ParkingSession.entry_time.desc()).all()
-        return logs
-    finally:
-        db.close()
+        regions.configure(camera_id, data.get("roi"))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Niepoprawny obszar: {e}")
+    return {"status": "ok", "camera": regions.stats()["cameras"][camera_id]}
+
+@app.delete("/regions/{camera_id}")
+def forget_detection_region(camera_id: str):
+    """Admin: usuwa obszar skonfigurowany i wyuczony kamery (uczenie zaczyna się od nowa, na pełnych klatkach)."""
+    if not regions.forget(camera_id):
+        raise HTTPException(status_code=404, detail="Nie znaleziono kamery")
+    return {"status": "ok"}
+
+@app.get("/zones")
+def zones_state():
+    """Zajętość stref (pojemność, zajęte, wolne) i przypisanie bramek/kamer do stref."""
+    return {"zones": parking.zones.snapshot(), "gates": parking.zones.gates,
+            "default_zone": parking.zones.default_zone, "rejected_full": parking.zones.rejected}
+
+@app.get("/db/stats")
+def db_stats():
+    """Statystyki zapisu do bazy (tryb zatwierdzania, rozmiary wsadów group commit, błędy)."""
+    return parking.writer.stats()
+
+def encode_cursor(timestamp, row_id):
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{row_id}".encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Niepoprawny kursor")
+
+@app.get("/logs")
+async def get_logs(
+    active: bool = False,
+    unpaid: bool = False,
+    plate_prefix: Optional[str] = None,
+    from_time: Optional[datetime] = None,
+    to_time: Optional[datetime] = None,
+    updated_since: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """Historia sesji stronicowana kursorem; tryb `updated_since` może powtórzyć rekordy - scalać po `id`."""
+    server_time = datetime.now() - timedelta(seconds=LOGS_DELTA_MARGIN_S + parking.writer.window_s)
+    query = select(ParkingSession)
+    if active:
+        query = query.where(ParkingSession.exit_time == None)
+    if unpaid:
+        query = query.where(ParkingSession.is_paid == False)
+    if plate_prefix:
+        escaped = plate_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.where(ParkingSession.plate.like(f"{escaped}%", escape="\\"))
+    if from_time:
+        query = query.where(ParkingSession.entry_time >= from_time)
+    if to_time:
+        query = query.where(ParkingSession.entry_time < to_time)
+
+    if updated_since:
+        # Tryb przyrostowy: od najstarszej zmiany, kursor po (updated_at, id)
+        order_col = ParkingSession.updated_at
+        query = query.where(ParkingSession.updated_at > updated_since)
+        if cursor:
+            query = query.where(tuple_(ParkingSession.updated_at, ParkingSession.id) > decode_cursor(cursor))
+        query = query.order_by(ParkingSession.updated_at.asc(), ParkingSession.id.asc())
+    else:
+        # Historia: od najnowszego wjazdu, kursor po (entry_time, id)
+        order_col = ParkingSession.entry_time
+        if cursor:
+            query = query.where(tuple_(ParkingSession.entry_time, ParkingSession.id) < decode_cursor(cursor))
+        query = query.order_by(ParkingSession.entry_time.desc(), ParkingSession.id.desc())
+
+    rows = (await db.scalars(query.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, order_col.key), last.id)
+
+    return {"items": rows, "next_cursor": next_cursor, "server_time": server_time}
+
+@app.get("/history")
+async def get_history(
+    plate_prefix: Optional[str] = None,
+    zone: Optional[str] = None,
+    from_time: Optional[datetime] = None,
+    to_time: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    unpaid: bool = False,
+):
+    """Historia sesji z bieżącej tabeli i archiwum, stronicowana jak /logs."""
+    rows, more = await query_history(
+        archiver.archive, plate_prefix.upper() if plate_prefix else None, zone, from_time, to_time,
+        decode_cursor(cursor) if cursor else None, limit, unpaid,
+    )
+    next_cursor = encode_cursor(rows[-1]["entry_time"], rows[-1]["id"]) if more else None
+    return {"items": rows, "next_cursor": next_cursor}
+
+@app.get("/history/summary")
+async def history_summary(zone: Optional[str] = None, from_time: Optional[datetime] = None,
+                          to_time: Optional[datetime] = None):
+    """Raporty: zamknięte sesje, opłacone, przychód i średni czas postoju w miesiącach i strefach (bieżące + archiwum)."""
+    return {"months": await summarize_history(archiver.archive, zone, from_time, to_time)}
+
+@app.get("/archive")
+async def archive_stats():
+    """Partycje archiwum (miesiąc, liczba sesji, rozmiar) i wynik ostatniego przebiegu."""
+    return await archiver.stats()
+
+@app.post("/archive/run")
+async def run_archive():
+    """Admin: natychmiastowe przeniesienie do archiwum sesji zamkniętych ponad ARCHIVE_AFTER_DAYS dni temu."""
+    if ARCHIVE_AFTER_DAYS <= 0:
+        raise HTTPException(status_code=409, detail="Archiwizacja wyłączona (ARCHIVE_AFTER_DAYS=0)")
+    return {"status": "ok", **await archiver.run()}
 
 @app.post("/pay")
-def pay_for_parking(data: dict):
+async def pay_for_parking(data: dict):
     """Symuluje opłacenie parkingu dla danego numeru rejestracyjnego."""
+    require_db()
     plate = data.get("plate")
-    db = SessionLocal()
     try:
-        session = db.query(ParkingSession).filter(
-            ParkingSession.plate == plate, 
-            ParkingSession.exit_time == None
-        ).first()
-        
-        if not session:
-            raise HTTPException(status_code=404, detail="Nie znaleziono aktywnego pojazdu")
-        
-        # Calculate fee dynamically
-        fee = parking.calculate_current_fee(session.entry_time)
-        
-        session.is_paid = True
-        session.amount_due = fee
-        db.commit()
-        
-        # Open gate on successful payment as requested
-        parking.open_gate()
-        
-        return {"message": f"Opłacono postój dla {plate}. Bramka otwarta.", "amount": fee}
-    finally:
-        db.close()
+        fee = await parking.pay(plate)
+    except RuntimeError:
+        raise HTTPException(status_code=503, detail="Nie udało się zapisać płatności, spróbuj ponownie")
+    if fee is None:
+        raise HTTPException(status_code=404, detail="Nie znaleziono aktywnego pojazdu")
+
+    # Open gate on successful payment as requested
+    parking.open_gate()
+
+    return {"message": f"Opłacono postój dla {plate}. Bramka otwarta.", "amount": fee}
+
+@app.get("/fees/active")
+async def active_fees():
+    """Bieżące opłaty wszystkich pojazdów na parkingu (jeden wektorowy przebieg taryfy)."""
+    sessions = sorted(parking.active_fees(), key=lambda s: s["entry_time"], reverse=True)
+    return {
+        "sessions": sessions,
+        "total_due": round(sum(s["current_fee"] for s in sessions if not s["is_paid"]), 2),
+        "tariff": parking.tariff.describe(),
+    }
+
+def sse(event):
+    """Zdarzenie w formacie Server-Sent Events; id = epoka:numer, do wznowienia przez Last-Event-ID."""
+    return (f"id: {parking.events.epoch}:{event['seq']}\nevent: {event['type']}\n"
+            f"data: {json.dumps(event, default=str)}\n\n")
+
+def replay_since(last_event_id):
+    """Zdarzenia po `last_event_id` z historii magistrali albo None, gdy klient musi pobrać pełny stan."""
+    epoch, _, seq = (last_event_id or "").partition(":")
+    if epoch != parking.events.epoch or not seq.isdigit():
+        return None
+    return parking.events.since(int(seq))
+
+@app.get("/events")
+async def event_stream(last_event_id: Optional[str] = Header(None)):
+    """Strumień zdarzeń parkingu (SSE): `snapshot`, potem zmiany; Last-Event-ID wznawia strumień."""
+    # Subskrypcja i stan początkowy w tym samym kroku pętli - żadne zdarzenie nie wpadnie pomiędzy
+    subscription = parking.events.subscribe()
+    replay = replay_since(last_event_id)
+    initial = [parking.snapshot()] if replay is None else replay
+
+    async def stream():
+        try:
+            for event in initial:
+                yield sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=EVENTS_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse(event)
+                if event["type"] == "resync":
+                    yield sse(parking.snapshot())
+        finally:
+            parking.events.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/crops/{crop_id}")
+def get_crop(crop_id: str, if_none_match: Optional[str] = Header(None)):
+    """Wycinek tablicy (JPEG). Treść pod danym id nigdy się nie zmienia - można go cache'ować bez końca."""
+    if len(crop_id) != 32 or any(c not in "0123456789abcdef" for c in crop_id):
+        raise HTTPException(status_code=404, detail="Nie znaleziono wycinka")
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{crop_id}"'}
+    if if_none_match and crop_id in if_none_match:
+        return Response(status_code=304, headers=headers)
+
+    data = crop_store.get(crop_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Nie znaleziono wycinka")
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+@app.post("/reconcile")
+async def reconcile():
+    """Admin: Porównanie pamięci podręcznej aktywnych sesji z bazą i naprawa rozbieżności."""
+    return {"status": "ok", **await parking.reconcile()}
 
 @app.post("/force_exit")
-def force_exit(data: dict):
+async def force_exit(data: dict):
     """Admin: Wymuszenie wyjazdu (Wypuść)."""
+    require_db()
     plate = data.get("plate")
-    msg = parking.force_exit(plate)
+    ok, msg = await parking.force_exit(plate)
+    if not ok:
+        # Jak /pay: brak pojazdu -> 404, nieudany zapis -> 503 (bramka pozostaje zamknięta)
+        raise HTTPException(status_code=404 if plate not in parking.active else 503, detail=msg)
     return {"status": "ok", "message": msg}
 
 @app.post("/manual_open")
@@ -101,71 +530,263 @@ def emergency_evacuation():
 
 # --- GŁÓWNY SILNIK PRZETWARZANIA ---
 
+async def apply_gate_logic(plate_texts, mode, image_paths=None, gate=None, at=None):
+    """Logika wjazdu/wyjazdu dla rozpoznanych tablic; `gate` wybiera strefę, `at` to czas zdarzenia."""
+    outcomes = []
+    for plate_text, image_path in zip(plate_texts, image_paths or [None] * len(plate_texts)):
+        if mode == "entry":
+            outcomes.append(await parking.process_entry(plate_text, image_path=image_path, gate=gate, at=at))
+        else:
+            outcomes.append(await parking.process_exit(plate_text, at=at))
+    return outcomes
+
+def run_on_loop(coro):
+    """Wywołanie korutyny w pętli zdarzeń z wątku roboczego (limit RUN_ON_LOOP_TIMEOUT_S)."""
+    future = asyncio.run_coroutine_threadsafe(coro, event_loop)
+    try:
+        return future.result(timeout=RUN_ON_LOOP_TIMEOUT_S)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"Pętla zdarzeń nie odpowiedziała w ciągu {RUN_ON_LOOP_TIMEOUT_S} s")
+
+def apply_with_consensus(readings, mode, camera_id, captured_at=None):
+    """Logika bramki przez głosowanie odczytów tego samego pojazdu."""
+    key, now = (camera_id, mode), None
+    if captured_at is not None:
+        key, now = (camera_id, mode, "captured"), captured_at.timestamp()
+    results = []
+    for plate_text, confidences, image_path in readings:
+        status, plate, confidence, outcome = consensus.submit(
+            key, plate_text, confidences,
+            lambda consensus_plate: run_on_loop(
+                apply_gate_logic([consensus_plate], mode, [image_path], gate=camera_id, at=captured_at))[0],
+            now=now,
+        )
+        metrics.CONSENSUS.labels(status=status).inc()
+        if outcome is None:
+            outcome = (False, "Odczyt niepewny - oczekiwanie na kolejne klatki")
+        results.append((outcome, {"plate": plate, "confidence": confidence, "status": status}))
+    return results
+
 @app.post("/process_frame")
-async def process_frame(file: UploadFile = File(...), mode: str = "entry"):
+async def process_frame(file: UploadFile = File(...), mode: str = "entry", camera_id: str = "default"):
     """
     Przetwarza zdjęcie z kamery:
     1. Wykrywa tablicę (YOLO).
     2. Rozpoznaje tekst (LPRNet).
-    3. Zapisuje w bazie i zwraca dane wraz z wycinkiem zdjęcia (Base64).
+    3. Zapisuje w bazie i zwraca dane wraz z odnośnikiem do wycinka (/crops/{id}).
     """
+    profiler = request_profiler.claim()
+    start = time.perf_counter()
     try:
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        result = await handle_frame(file, mode, camera_id)
+    finally:
+        STAGE_SECONDS.labels(stage="frame").observe(time.perf_counter() - start)
+        if profiler is not None:
+            # Zatrzymanie czeka na wątek próbkujący - poza pętlą zdarzeń
+            profile_id = await run_in_threadpool(
+                request_profiler.finish, profiler, label=f"process_frame camera={camera_id} mode={mode}")
+    if profiler is not None:
+        result["profile_id"] = profile_id
+    return result
 
-        results = yolo(img)
-        detections = []
-        message = "Brak wykrycia"
-        open_barrier = False
-        plate_base64 = None
+async def handle_frame(file, mode, camera_id):
+    if not models.ready:
+        metrics.FRAMES.labels(result="not_ready").inc()
+        raise HTTPException(status_code=503, detail="Modele AI nie są gotowe", headers={"Retry-After": "5"})
+    require_db()
+    # Back-pressure: odrzucamy klatki zamiast blokować endpointy sterujące
+    if scheduler.queue_depth >= INFERENCE_MAX_QUEUE:
+        metrics.FRAMES.labels(result="rejected").inc()
+        raise HTTPException(status_code=503, detail="Kolejka inferencji pełna", headers={"Retry-After": "1"})
+    if not frame_executor.try_acquire():
+        metrics.FRAMES.labels(result="rejected").inc()
+        raise HTTPException(status_code=429, detail="Zbyt wiele klatek w obróbce", headers={"Retry-After": "1"})
 
-        if results:
-            for res in results:
-                for box in res.boxes:
-                    cls_id = int(box.cls[0])
-                    if cls_id != 0: continue # Interesują nas tylko tablice
+    try:
+        contents = await file.read()
+        with STAGE_SECONDS.labels(stage="decode").time():
+            img = await frame_executor.run(decode_image, contents)
+        if img is None:
+            metrics.FRAMES.labels(result="error").inc()
+            return {"error": "Nie można zdekodować obrazu", "barrier": False}
 
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    
-                    # Cropowanie z zabezpieczeniem krawędzi
-                    crop = img[max(0, y1):min(img.shape[0], y2), max(0, x1):min(img.shape[1], x2)]
-                    
-                    if crop.size > 0:
-                        # 1. Rozpoznawanie tekstu LPRNet
-                        temp_img = cv2.resize(crop, (94, 24)).astype('float32')
-                        temp_img = (temp_img - 127.5) * 0.0078125
-                        temp_img = torch.from_numpy(temp_img).permute(2, 0, 1).unsqueeze(0).to(DEVICE)
-                        
-                        with torch.no_grad():
-                            logits = lpr(temp_img)
-                            plate_text = decode_lpr(logits)
-
-                        # 2. Konwersja wycinka do Base64, aby wyświetlić go w przeglądarce
-                        _, buffer = cv2.imencode('.jpg', crop)
-                        plate_base64 = base64.b64encode(buffer).decode('utf-8')
-
-                        # 3. Logika wjazdu/wyjazdu
-                        if mode == "entry":
-                            success, msg = parking.process_entry(plate_text)
-                        else:
-                            success, msg = parking.process_exit(plate_text)
-                        
-                        open_barrier = success
-                        message = msg
-                        detections.append({
-                            "plate": plate_text, 
-                            "box": [x1, y1, x2, y2],
-                            "image": plate_base64
-                        })
-
-        return {
-            "detections": detections, 
-            "message": message, 
-            "barrier": open_barrier, 
-            "spots": parking.free_spots['A']
-        }
+        # 1. Wykrywanie i rozpoznawanie - wsadowo razem z klatkami z innych kamer
+        with STAGE_SECONDS.labels(stage="inference").time():
+            plates = await scheduler.submit((img, camera_id))
+        return await gate_plates(plates, mode, camera_id)
 
     except Exception as e:
         print(f"Error processing frame: {e}")
-        return {"error": str(e), "barrier": False}
\ No newline at end of file
+        metrics.FRAMES.labels(result="error").inc()
+        return {"error": str(e), "barrier": False}
+    finally:
+        frame_executor.release()
+
+async def gate_plates(plates, mode, camera_id, captured_at=None):
+    """Wycinki do magazynu i logika bramki dla tablic rozpoznanych na jednej klatce; odpowiedź dla klatki."""
+    detections = []
+    message = "Brak wykrycia"
+    open_barrier = False
+
+    if plates:
+        boxes, crops, plate_texts, confidences = zip(*plates)
+
+        # 2. Wycinki do magazynu (zapis w tle) - w odpowiedzi tylko odnośnik
+        crop_urls = [f"/crops/{crop_store.put(crop)}" for crop in crops]
+
+        # 3. Logika wjazdu/wyjazdu (po konsensusie odczytów z kolejnych klatek)
+        outcomes = await run_in_threadpool(
+            apply_with_consensus, list(zip(plate_texts, confidences, crop_urls)), mode, camera_id, captured_at
+        )
+
+        for box, plate_text, char_conf, crop_url, ((success, msg), voted) in zip(
+                boxes, plate_texts, confidences, crop_urls, outcomes):
+            open_barrier = success
+            message = msg
+            detections.append({
+                "plate": plate_text, 
+                "box": box,
+                "image_url": crop_url,
+                "char_confidence": char_conf,
+                "consensus": voted,
+            })
+
+    metrics.FRAMES.labels(result="detected" if detections else "no_detection").inc()
+    return {
+        "detections": detections, 
+        "message": message, 
+        "barrier": open_barrier, 
+        "spots": parking.free_spots[parking.zones.resolve(gate=camera_id)]
+    }
+
+# --- WSADY KLATEK (uzupełnianie po awarii, paczki z kamer brzegowych) ---
+
+@app.post("/process_batch")
+async def process_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    metadata: Optional[str] = Form(None),
+    mode: str = "entry",
+    camera_id: str = "default",
+):
+    """
+    Przetwarza wiele klatek (`files` albo archiwum zip/tar) w kolejności `captured_at` z `metadata`.
+    Wyniki jako NDJSON: linia na klatkę, na końcu `summary`.
+    """
+    if not models.ready:
+        raise HTTPException(status_code=503, detail="Modele AI nie są gotowe", headers={"Retry-After": "5"})
+    require_db()
+    if scheduler.queue_depth >= INFERENCE_MAX_QUEUE:
+        raise HTTPException(status_code=503, detail="Kolejka inferencji pełna", headers={"Retry-After": "1"})
+    defaults = {"mode": mode, "camera_id": camera_id}
+    try:
+        meta = parse_metadata(metadata)
+        if archive is not None:
+            frames = await run_in_threadpool(frames_from_archive, archive.file, meta, defaults)
+        else:
+            frames = frames_from_uploads(files or [], meta, defaults)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not frames:
+        raise HTTPException(status_code=400, detail="Brak klatek do przetworzenia")
+    if len(frames) > BATCH_MAX_FRAMES:
+        raise HTTPException(status_code=413, detail=f"Za dużo klatek w jednym wsadzie (limit {BATCH_MAX_FRAMES})")
+    frames = order_by_capture(frames)
+    chunks = [frames[i:i + BATCH_CHUNK] for i in range(0, len(frames), BATCH_CHUNK)]
+    if batch_slots.locked():
+        raise HTTPException(status_code=503, detail="Trwa przetwarzanie innego wsadu", headers={"Retry-After": "5"})
+
+    async def recognize(frame):
+        contents = await run_in_threadpool(frame.read)
+        with STAGE_SECONDS.labels(stage="decode").time():
+            img = await frame_executor.run(decode_image, contents)
+        if img is None:
+            return None
+        with STAGE_SECONDS.labels(stage="inference").time():
+            return await scheduler.submit((img, frame.camera_id))
+
+    def recognize_chunk(chunk):
+        return asyncio.ensure_future(asyncio.gather(*(recognize(frame) for frame in chunk), return_exceptions=True))
+
+    async def stream():
+        # Miejsce zajmowane dopiero przy strumieniowaniu - odpowiedź, która nie ruszyła, nic nie trzyma
+        async with batch_slots:
+            start = time.perf_counter()
+            counts = Counter()
+            pending = recognize_chunk(chunks[0])
+            try:
+                for n, chunk in enumerate(chunks):
+                    results = await pending
+                    # Następna porcja rozpoznawana w tle, gdy ta przechodzi przez logikę bramki
+                    pending = recognize_chunk(chunks[n + 1]) if n + 1 < len(chunks) else None
+                    for frame, plates in zip(chunk, results):
+                        line = {"index": frame.index, "name": frame.name, "camera_id": frame.camera_id,
+                                "mode": frame.mode, "captured_at": frame.captured_at}
+                        try:
+                            if plates is None:
+                                raise ValueError("Nie można zdekodować obrazu")
+                            if isinstance(plates, Exception):
+                                raise plates
+                            line.update(await gate_plates(plates, frame.mode, frame.camera_id, frame.captured_at))
+                            counts["detected" if line["detections"] else "no_detection"] += 1
+                            counts["barrier_opened"] += line["barrier"]
+                        except Exception as e:
+                            print(f"Error processing batch frame {frame.name}: {e}")
+                            metrics.FRAMES.labels(result="error").inc()
+                            counts["errors"] += 1
+                            line.update(error=str(e), barrier=False)
+                        yield json.dumps(line, default=str) + "\n"
+            finally:
+                if pending is not None:
+                    pending.cancel()
+            elapsed = time.perf_counter() - start
+            summary = {"frames": len(frames), "detected": counts["detected"], "no_detection": counts["no_detection"],
+                       "errors": counts["errors"], "barrier_opened": counts["barrier_opened"],
+                       "elapsed_s": round(elapsed, 3), "frames_per_s": round(len(frames) / elapsed, 1)}
+            yield json.dumps({"summary": summary}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# --- STRUMIENIE WIDEO (plik / RTSP) ---
+
+def infer_from_thread(frame, camera_id):
+    """Inferencja z wątku kamery przez wspólny scheduler (wsadowo z klatkami z /process_frame)."""
+    return run_on_loop(scheduler.submit((frame, camera_id)))
+
+def gate_decision(plate_text, mode, crop=None, camera_id=None):
+    image_path = f"/crops/{crop_store.put(crop)}" if crop is not None else None
+    return run_on_loop(apply_gate_logic([plate_text], mode, [image_path], gate=camera_id))[0]
+
+streams = StreamManager(infer_from_thread, gate_decision)
+
+@app.post("/streams")
+def start_stream(data: dict):
+    """Uruchamia odczyt strumienia z kamery (camera_id, source, mode; opcjonalnie parametry próbkowania)."""
+    camera_id = data.get("camera_id")
+    source = data.get("source")
+    if not camera_id or not source:
+        raise HTTPException(status_code=400, detail="Wymagane pola: camera_id, source")
+    if not models.ready:
+        raise HTTPException(status_code=503, detail="Modele AI nie są gotowe", headers={"Retry-After": "5"})
+    require_db()
+    options = {key: int(data[key]) for key in ("min_interval", "max_interval", "min_readings") if key in data}
+    if "min_confidence" in data:
+        options["min_confidence"] = float(data["min_confidence"])
+    try:
+        worker = streams.start(camera_id, source, data.get("mode", "entry"), **options)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "ok", "stream": worker.stats()}
+
+@app.delete("/streams/{camera_id}")
+def stop_stream(camera_id: str):
+    """Zatrzymuje odczyt strumienia z kamery."""
+    if not streams.stop(camera_id):
+        raise HTTPException(status_code=404, detail="Nie znaleziono strumienia")
+    return {"status": "ok"}
+
+@app.get("/streams")
+def list_streams():
+    """Stan strumieni: klatki odczytane/próbkowane, ruch, śledzone tablice, ostatnie decyzje."""
+    return streams.stats()
@@ -0,0 +1,28 @@
+"""Prometheus metrics of the recognition pipeline and the gate, exposed by GET /metrics."""
+from prometheus_client import Counter, Gauge, Histogram
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = Histogram(
+    "parking_stage_seconds", "Latency of one pipeline stage", ["stage"], buckets=LATENCY_BUCKETS,
+)
+
+FRAMES = Counter(
+    "parking_frames_total", "Frames received by /process_frame, by outcome "
+    "(detected, no_detection, rejected, not_ready, error)", ["result"],
+)
+DETECTIONS = Counter("parking_detections_total", "Plates detected and read")
+CONSENSUS = Counter("parking_consensus_total", "Plate readings by consensus status", ["status"])
+ENTRIES = Counter(
+    "parking_entries_total", "Entry attempts by result (allowed, inside, full, error)", ["result"],
+)
+EXITS = Counter(
+    "parking_exits_total", "Exit attempts by result (allowed, unpaid, not_found, before_entry, error)", ["result"],
+)
+
+OCCUPANCY = Gauge("parking_occupancy", "Vehicles on the parking, per zone", ["zone"])
+CAPACITY = Gauge("parking_capacity", "Parking spots, per zone", ["zone"])
+INFERENCE_QUEUE = Gauge("parking_inference_queue_depth", "Frames waiting for the inference scheduler")
+FRAMES_IN_FLIGHT = Gauge("parking_frames_in_flight", "Frames being processed by /process_frame")
+DB_QUEUE = Gauge("parking_db_write_queue_depth", "Writes waiting for the DB writer")
+EVENT_SUBSCRIBERS = Gauge("parking_event_subscribers", "Clients connected to the /events stream")
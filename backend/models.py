@@ -0,0 +1,130 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import numpy as np
+
+
+@dataclass
+class ModelStatus:
+    """Load state of one model: pending -> loading -> warming -> ready, or failed."""
+    name: str
+    state: str = "pending"
+    load_s: Optional[float] = None
+    warmup_s: Optional[float] = None
+    error: Optional[str] = None
+
+
+class ModelRegistry:
+    """Loads and warms up YOLO and LPRNet in background threads, in parallel."""
+
+    def __init__(self, yolo_weights, lpr_backend, lpr_weights, torchscript_path, onnx_path, lpr_threads=None):
+        self.yolo_weights = yolo_weights
+        self.lpr_backend = lpr_backend
+        self.lpr_weights = lpr_weights
+        self.torchscript_path = torchscript_path
+        self.onnx_path = onnx_path
+        self.lpr_threads = lpr_threads
+
+        self.yolo = None
+        self.lpr = None
+        self.preprocess = None
+        self.device = None
+        self.status = {"yolo": ModelStatus("yolo"), "lpr": ModelStatus("lpr")}
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._finished = 0
+        self._done = threading.Event()
+
+    @property
+    def ready(self):
+        return all(s.state == "ready" for s in self.status.values())
+
+    @property
+    def failed(self):
+        return any(s.state == "failed" for s in self.status.values())
+
+    def start(self):
+        """Start loading both models; returns immediately."""
+        self.started_at = time.monotonic()
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="model-loader")
+        pool.submit(self._load, "yolo", self._load_yolo, self._warmup_yolo)
+        pool.submit(self._load, "lpr", self._load_lpr, self._warmup_lpr)
+        pool.shutdown(wait=False)
+
+    def wait(self, timeout=None):
+        """Block until loading has finished (ready or failed). Returns `ready`."""
+        self._done.wait(timeout)
+        return self.ready
+
+    def _get_device(self):
+        with self._lock:
+            if self.device is None:
+                import torch
+                self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            return self.device
+
+    def _load(self, name, load, warmup):
+        status = self.status[name]
+        try:
+            status.state = "loading"
+            start = time.monotonic()
+            load()
+            status.load_s = time.monotonic() - start
+
+            status.state = "warming"
+            start = time.monotonic()
+            warmup()
+            status.warmup_s = time.monotonic() - start
+
+            status.state = "ready"
+            print(f"Model {name} ready (load {status.load_s:.2f} s, warm-up {status.warmup_s:.2f} s)")
+        except Exception as e:
+            status.state = "failed"
+            status.error = str(e)
+            print(f"CRITICAL ERROR loading model {name}: {e}")
+
+        with self._lock:
+            self._finished += 1
+            if self._finished == len(self.status):
+                self.finished_at = time.monotonic()
+                self._done.set()
+
+    def _load_yolo(self):
+        from ultralytics import YOLO
+        self._get_device()
+        self.yolo = YOLO(self.yolo_weights, task="detect")
+
+    def _warmup_yolo(self):
+        self.yolo(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+
+    def _load_lpr(self):
+        from lpr_runtime import load_lpr
+        from lprnet_arch import PlatePreprocessor
+        # Preallocated input buffers, reused by every batch
+        self.preprocess = PlatePreprocessor()
+        self.lpr = load_lpr(
+            self.lpr_backend, self._get_device(),
+            weights=self.lpr_weights,
+            torchscript_path=self.torchscript_path,
+            onnx_path=self.onnx_path,
+            threads=self.lpr_threads,
+        )
+
+    def _warmup_lpr(self):
+        from lprnet_arch import decode_lpr
+        batch = self.preprocess([np.zeros((24, 94, 3), dtype=np.uint8)], self.device)
+        decode_lpr(self.lpr(batch))
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "ready": self.ready,
+            "device": str(self.device) if self.device is not None else None,
+            "lpr_backend": self.lpr_backend,
+            "loading_s": (self.finished_at or now) - self.started_at if self.started_at else None,
+            "models": {name: asdict(status) for name, status in self.status.items()},
+        }
@@ -0,0 +1,58 @@
+from collections import defaultdict
+from itertools import combinations
+
+import Levenshtein
+
+
+def _deletes(word, max_distance):
+    """All strings obtained from `word` by deleting up to `max_distance` characters."""
+    result = {word}
+    for k in range(1, min(max_distance, len(word)) + 1):
+        for positions in combinations(range(len(word)), k):
+            result.add("".join(ch for i, ch in enumerate(word) if i not in positions))
+    return result
+
+
+class PlateIndex:
+    """In-memory fuzzy index of active plates (SymSpell-style deletion variants)."""
+
+    def __init__(self, max_distance=2):
+        self.max_distance = max_distance
+        self._variants = defaultdict(set)   # deletion variant -> plates
+        self._sessions = defaultdict(set)   # plate -> active session ids
+
+    def add(self, plate, session_id):
+        if plate not in self._sessions:
+            for variant in _deletes(plate, self.max_distance):
+                self._variants[variant].add(plate)
+        self._sessions[plate].add(session_id)
+
+    def remove(self, plate, session_id):
+        ids = self._sessions.get(plate)
+        if not ids:
+            return
+        ids.discard(session_id)
+        if ids:
+            return
+        del self._sessions[plate]
+        for variant in _deletes(plate, self.max_distance):
+            plates = self._variants[variant]
+            plates.discard(plate)
+            if not plates:
+                del self._variants[variant]
+
+    def best_match(self, plate):
+        """Closest active plate within `max_distance`: (plate, session_id, distance) or None; oldest on ties."""
+        candidates = set()
+        for variant in _deletes(plate, self.max_distance):
+            candidates.update(self._variants.get(variant, ()))
+
+        best = None
+        for candidate in candidates:
+            dist = Levenshtein.distance(plate, candidate)
+            if dist > self.max_distance:
+                continue
+            session_id = min(self._sessions[candidate])
+            if best is None or (dist, session_id) < (best[2], best[1]):
+                best = (candidate, session_id, dist)
+        return best
@@ -0,0 +1,108 @@
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Leaf frames in these files are threads blocked on a lock, queue or socket, not doing work
+IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "thread.py")
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads every `interval_s`; result in folded-stack format."""
+
+    def __init__(self, interval_s=0.005, include_idle=False):
+        self.interval_s = interval_s
+        self.include_idle = include_idle
+        self.samples = Counter()
+        self.started_at = None
+        self.duration_s = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling. Waits for the sampling thread, up to one interval - do not call on the event loop."""
+        self.duration_s = time.monotonic() - self.started_at
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if not self.include_idle and os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+class RequestProfiler:
+    """Runtime switch that profiles the next `requests` requests; keeps the last `keep` profiles."""
+
+    def __init__(self, keep=10):
+        self.keep = keep
+        self.armed = 0
+        self.interval_s = 0.005
+        self.include_idle = False
+        self._profiles = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def arm(self, requests=1, interval_ms=5.0, include_idle=False):
+        with self._lock:
+            self.armed = requests
+            self.interval_s = interval_ms / 1000.0
+            self.include_idle = include_idle
+
+    def claim(self):
+        """A started profiler if profiling is armed, otherwise None."""
+        with self._lock:
+            if self.armed <= 0:
+                return None
+            self.armed -= 1
+            profiler = SamplingProfiler(self.interval_s, self.include_idle)
+        profiler.start()
+        return profiler
+
+    def finish(self, profiler, label=""):
+        """Stop the profiler and store its profile. Returns the profile id. Blocks, see SamplingProfiler.stop."""
+        profiler.stop()
+        with self._lock:
+            profile_id = next(self._ids)
+            self._profiles[profile_id] = {
+                "id": profile_id,
+                "label": label,
+                "duration_s": profiler.duration_s,
+                "samples": sum(profiler.samples.values()),
+                "folded": profiler.folded(),
+            }
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id):
+        return self._profiles.get(profile_id)
+
+    def stats(self):
+        return {
+            "armed": self.armed,
+            "interval_ms": self.interval_s * 1000,
+            "profiles": [{k: v for k, v in p.items() if k != "folded"} for p in self._profiles.values()],
+        }
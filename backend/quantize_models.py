@@ -0,0 +1,127 @@
+"""INT8 quantization of LPRNet and YOLO (ONNX Runtime): python quantize_models.py --calib-images ... --out-dir ..."""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+
+from lpr_runtime import export_onnx, load_eager_model
+from lprnet_arch import preprocess_plates
+
+YOLO_IMGSZ = 640
+
+
+def load_images(images_dir):
+    return [cv2.imread(path) for path in sorted(glob.glob(os.path.join(images_dir, "*.jpg")))]
+
+
+def detect_plate_crops(yolo, images):
+    crops = []
+    for img, res in zip(images, yolo(images, verbose=False)):
+        for box in res.boxes:
+            if int(box.cls[0]) != 0: continue
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            crop = img[max(0, y1):min(img.shape[0], y2), max(0, x1):min(img.shape[1], x2)]
+            if crop.size > 0:
+                crops.append(crop)
+    return crops
+
+
+def grid_crops(images, size=(150, 40), step=(75, 40)):
+    crops = []
+    for img in images:
+        for y in range(0, img.shape[0] - size[1] + 1, step[1]):
+            for x in range(0, img.shape[1] - size[0] + 1, step[0]):
+                crops.append(img[y:y + size[1], x:x + size[0]])
+    return crops
+
+
+def letterbox(img, size=YOLO_IMGSZ):
+    """YOLO input: aspect-preserving resize, grey padding, RGB CHW float in [0, 1]."""
+    h, w = img.shape[:2]
+    scale = min(size / h, size / w)
+    nh, nw = round(h * scale), round(w * scale)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh))
+    return canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32)[None] / 255.0
+
+
+class CalibrationReader:
+    """Feeds calibration samples to onnxruntime.quantization one by one."""
+
+    def __init__(self, input_name, samples):
+        self.input_name = input_name
+        self._samples = iter(samples)
+
+    def get_next(self):
+        sample = next(self._samples, None)
+        return None if sample is None else {self.input_name: sample}
+
+
+def quantize_onnx_static(src, dst, input_name, samples):
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    quantize_static(
+        src, dst, CalibrationReader(input_name, samples),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+        per_channel=True, calibrate_method=CalibrationMethod.Percentile,
+    )
+
+
+def quantize_lprnet(weights, crops, dst):
+    tmp = tempfile.mkdtemp()
+    try:
+        fp32_path = os.path.join(tmp, "lprnet.onnx")
+        export_onnx(load_eager_model(weights, "cpu"), fp32_path)
+        samples = [preprocess_plates([crop], "cpu").numpy() for crop in crops]
+        quantize_onnx_static(fp32_path, dst, "input", samples)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def quantize_yolo(yolo, images, dst):
+    fp32_path = yolo.export(format="onnx", imgsz=YOLO_IMGSZ, dynamic=True, simplify=False)
+    samples = [letterbox(img) for img in images]
+    quantize_onnx_static(fp32_path, dst, "images", samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calib-images", default="/app/images")
+    parser.add_argument("--lpr-weights", default="/app/weights/lprnet_best.pth")
+    parser.add_argument("--yolo-weights", default="/app/weights/best.pt")
+    parser.add_argument("--out-dir", default="/app/weights")
+    parser.add_argument("--skip-yolo", action="store_true")
+    args = parser.parse_args()
+
+    images = load_images(args.calib_images)
+    if not images:
+        raise SystemExit(f"No calibration images in {args.calib_images}")
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    yolo = None
+    if os.path.exists(args.yolo_weights):
+        from ultralytics import YOLO
+        yolo = YOLO(args.yolo_weights)
+
+    crops = detect_plate_crops(yolo, images) if yolo else []
+    if not crops:
+        print("No detector or no plates found - calibrating LPRNet on grid crops")
+        crops = grid_crops(images)
+    lpr_dst = os.path.join(args.out_dir, "lprnet.int8.onnx")
+    quantize_lprnet(args.lpr_weights, crops, lpr_dst)
+    print(f"LPRNet INT8 ({len(crops)} calibration crops) saved to {lpr_dst}")
+
+    if yolo and not args.skip_yolo:
+        yolo_dst = os.path.join(args.out_dir, "best.int8.onnx")
+        quantize_yolo(yolo, images, yolo_dst)
+        print(f"YOLO INT8 ({len(images)} calibration frames) saved to {yolo_dst}")
+
+
+if __name__ == "__main__":
+    main()
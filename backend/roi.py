@@ -0,0 +1,223 @@
+import json
+import math
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+STRIDE = 32  # YOLO input sizes are multiples of the model stride
+PAD_VALUE = (114, 114, 114)  # ultralytics' letterbox fill
+
+
+@dataclass
+class RegionPlan:
+    """How one frame is fed to the detector: the region cut out of it and the downscale applied to it."""
+    x1: int
+    y1: int
+    x2: int
+    y2: int
+    scale: float  # detector pixels per frame pixel
+    imgsz: int  # detector input size (long side)
+    source: str  # "config", "learned" or "full"
+
+    def to_frame(self, box):
+        """Map an (x1, y1, x2, y2) box from detector input coordinates back to the full-resolution frame."""
+        bx1, by1, bx2, by2 = box
+        return [
+            min(self.x2, self.x1 + bx1 / self.scale), min(self.y2, self.y1 + by1 / self.scale),
+            min(self.x2, self.x1 + bx2 / self.scale), min(self.y2, self.y1 + by2 / self.scale),
+        ]
+
+
+class _Camera:
+    def __init__(self, history):
+        self.configured = None  # (x1, y1, x2, y2), normalized to the frame size
+        self.learned = None
+        self.boxes = deque(maxlen=history)  # recent detections, normalized
+        self.new_samples = 0
+        self.frames = 0
+
+
+class DetectionRegions:
+    """Per-camera regions of interest (configured or learned) and resolution-adaptive detector input."""
+
+    def __init__(self, target_size=640, min_size=320, configured=None, learn=True, min_samples=50,
+                 history=500, explore_every=50, max_area=0.8, max_cameras=256, path=None):
+        self.target_size = target_size
+        self.min_size = min_size
+        self.learn_enabled = learn
+        self.min_samples = min_samples
+        self.history = history
+        self.explore_every = explore_every
+        self.max_area = max_area  # a learned region covering more than this is not worth cropping
+        self.max_cameras = max_cameras
+        self.path = path
+        self._cameras = {}
+        self._lock = threading.Lock()
+        for camera_id, roi in (configured or {}).items():
+            self._camera(camera_id).configured = _validate(roi)
+        self._load()
+
+    def _camera(self, camera_id):
+        camera = self._cameras.get(camera_id)
+        if camera is None:
+            camera = self._cameras[camera_id] = _Camera(self.history)
+        return camera
+
+    @classmethod
+    def from_env(cls):
+        """Regions from CAMERA_ROIS ('{"north": [0.2, 0.4, 0.8, 1.0]}', fractions of the frame), sizes from INFERENCE_SIZE."""
+        return cls(
+            target_size=int(os.environ.get("INFERENCE_SIZE", 640)),
+            min_size=int(os.environ.get("INFERENCE_MIN_SIZE", 320)),
+            configured=json.loads(os.environ.get("CAMERA_ROIS", "{}")),
+            learn=os.environ.get("ROI_LEARN", "1") == "1",
+            min_samples=int(os.environ.get("ROI_MIN_SAMPLES", 50)),
+            max_cameras=int(os.environ.get("ROI_MAX_CAMERAS", 256)),
+            path=os.environ.get("ROI_PROFILES_PATH", "/app/data/roi_profiles.json"),
+        )
+
+    def configure(self, camera_id, roi):
+        """Set (or with None clear) and persist the configured region of a camera; it takes precedence over the learned one."""
+        if roi is not None:
+            roi = _validate(roi)
+        with self._lock:
+            self._camera(camera_id).configured = roi
+            self._save()
+
+    def forget(self, camera_id):
+        """Drop everything known about a camera (configured and learned region, samples)."""
+        with self._lock:
+            found = self._cameras.pop(camera_id, None) is not None
+            self._save()
+        return found
+
+    def plan(self, camera_id, shape):
+        height, width = shape[:2]
+        roi = None
+        with self._lock:
+            camera = self._cameras.get(camera_id)
+            if camera is not None:
+                camera.frames += 1
+                roi, source = camera.configured, "config"
+                if roi is None and camera.learned is not None and camera.frames % self.explore_every:
+                    roi, source = camera.learned, "learned"
+        if roi is None:
+            x1, y1, x2, y2, source = 0, 0, width, height, "full"
+        else:
+            x1, y1 = int(roi[0] * width), int(roi[1] * height)
+            x2, y2 = max(x1 + 1, math.ceil(roi[2] * width)), max(y1 + 1, math.ceil(roi[3] * height))
+        # Plate pixel size as in the full frame letterboxed to target_size, within [min_size, target_size]
+        region_long = max(x2 - x1, y2 - y1)
+        size = min(self.target_size, max(self.min_size, self.target_size * region_long / max(width, height)))
+        scale = min(1.0, size / region_long)
+        # A region smaller than min_size is inferred at min_size; prepare() pads it so it is not upscaled
+        imgsz = math.ceil(max(self.min_size, region_long * scale) / STRIDE) * STRIDE
+        return RegionPlan(x1, y1, x2, y2, scale, imgsz, source)
+
+    def prepare(self, image, camera_id):
+        """Detector input for a frame: (image, RegionPlan). The input is a new array only if it is resized or padded."""
+        plan = self.plan(camera_id, image.shape)
+        region = image[plan.y1:plan.y2, plan.x1:plan.x2]
+        if plan.scale < 1.0:
+            size = (max(1, round(region.shape[1] * plan.scale)), max(1, round(region.shape[0] * plan.scale)))
+            region = cv2.resize(region, size, interpolation=cv2.INTER_LINEAR)
+        height, width = region.shape[:2]
+        if max(height, width) < plan.imgsz:
+            # Long side up to imgsz, so the letterbox ratio is 1; the padding is below/right of the
+            # region and leaves box coordinates unchanged
+            bottom, right = (plan.imgsz - height, 0) if height >= width else (0, plan.imgsz - width)
+            region = cv2.copyMakeBorder(region, 0, bottom, 0, right, cv2.BORDER_CONSTANT, value=PAD_VALUE)
+        return region, plan
+
+    def learn(self, camera_id, boxes, shape):
+        """Record a frame's detection boxes (full-resolution pixels) and refresh the learned region."""
+        if not self.learn_enabled or not boxes:
+            return
+        height, width = shape[:2]
+        with self._lock:
+            if camera_id not in self._cameras and len(self._cameras) >= self.max_cameras:
+                return
+            camera = self._camera(camera_id)
+            for x1, y1, x2, y2 in boxes:
+                camera.boxes.append((x1 / width, y1 / height, x2 / width, y2 / height))
+            camera.new_samples += len(boxes)
+            if len(camera.boxes) < self.min_samples or camera.new_samples < self.min_samples // 5:
+                return
+            camera.new_samples = 0
+            camera.learned = self._fit(np.array(camera.boxes))
+            self._save()
+
+    def _fit(self, boxes):
+        lo = np.quantile(boxes[:, :2], 0.01, axis=0)
+        hi = np.quantile(boxes[:, 2:], 0.99, axis=0)
+        # Padding of half a median plate (plus 2% of the frame) for plates just outside the seen extent
+        pad = np.median(boxes[:, 2:] - boxes[:, :2], axis=0) / 2 + 0.02
+        lo, hi = np.clip(lo - pad, 0.0, 1.0), np.clip(hi + pad, 0.0, 1.0)
+        if (hi - lo).prod() > self.max_area:
+            return None
+        return tuple(round(float(v), 4) for v in (*lo, *hi))
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                profiles = json.load(f)
+            for camera_id, profile in profiles.items():
+                if isinstance(profile, list):
+                    profile = {"learned": profile}  # learned region only, as saved before configured ones were kept
+                camera = self._camera(camera_id)
+                if profile.get("learned"):
+                    camera.learned = _validate(profile["learned"])
+                if profile.get("configured"):
+                    camera.configured = _validate(profile["configured"])
+            print(f"Loaded detection regions for {len(profiles)} cameras")
+        except (OSError, ValueError) as e:
+            print(f"Could not load detection regions from {self.path}: {e}")
+
+    def _save(self):
+        # Called under the lock; small file, rewritten atomically
+        if not self.path:
+            return
+        profiles = {
+            camera_id: {"learned": camera.learned, "configured": camera.configured}
+            for camera_id, camera in self._cameras.items() if camera.learned or camera.configured
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(profiles, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not save detection regions to {self.path}: {e}")
+
+    def stats(self):
+        with self._lock:
+            cameras = {
+                camera_id: {
+                    "configured": camera.configured,
+                    "learned": camera.learned,
+                    "samples": len(camera.boxes),
+                    "frames": camera.frames,
+                }
+                for camera_id, camera in self._cameras.items()
+            }
+        return {
+            "target_size": self.target_size,
+            "min_size": self.min_size,
+            "learn": self.learn_enabled,
+            "min_samples": self.min_samples,
+            "cameras": cameras,
+        }
+
+
+def _validate(roi):
+    x1, y1, x2, y2 = (float(v) for v in roi)
+    if not (0.0 <= x1 < x2 <= 1.0 and 0.0 <= y1 < y2 <= 1.0):
+        raise ValueError(f"Region must be [x1, y1, x2, y2] fractions of the frame with x1 < x2, y1 < y2: {roi}")
+    return (x1, y1, x2, y2)
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InferenceScheduler:
+    """Micro-batching scheduler: gathers concurrent frames into batches for `infer_fn` on one thread."""
+
+    def __init__(self, infer_fn, max_batch_size=8, max_wait_ms=10):
+        # infer_fn: list of frames -> list of results (same order and length)
+        self.infer_fn = infer_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._queue = None
+        self._task = None
+
+        # Metrics
+        self.batches = 0
+        self.frames = 0
+        self.batch_sizes = Counter()
+        self.last_batch_ms = 0.0
+        self.fallbacks = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._worker.shutdown(wait=False)
+
+    async def submit(self, frame):
+        """Queue a frame for inference and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((frame, future))
+        return await future
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    async def _collect_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            # Requests that were cancelled while waiting (client gone) are dropped
+            batch = [(frame, fut) for frame, fut in batch if not fut.done()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.frames += len(batch)
+            self.batch_sizes[len(batch)] += 1
+
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._worker, self.infer_fn, [frame for frame, _ in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    self._resolve(batch[0][1], error=e)
+                else:
+                    self.fallbacks += 1
+                    await self._run_one_by_one(batch)
+                continue
+            finally:
+                self.last_batch_ms = (time.perf_counter() - start) * 1000
+
+            for (_, fut), result in zip(batch, results):
+                self._resolve(fut, result)
+
+    async def _run_one_by_one(self, batch):
+        loop = asyncio.get_running_loop()
+        for frame, fut in batch:
+            if fut.done():
+                continue
+            try:
+                [result] = await loop.run_in_executor(self._worker, self.infer_fn, [frame])
+            except Exception as e:
+                self._resolve(fut, error=e)
+            else:
+                self._resolve(fut, result)
+
+    @staticmethod
+    def _resolve(fut, result=None, error=None):
+        if fut.done():
+            return
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "frames": self.frames,
+            "avg_batch_size": self.frames / self.batches if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "last_batch_ms": self.last_batch_ms,
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,286 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from consensus import PlateConsensus
+
+
+class MotionDetector:
+    """Frame-difference motion detector on a small blurred greyscale copy of the frame."""
+
+    def __init__(self, threshold=25, min_changed=0.01, size=(160, 90)):
+        self.threshold = threshold
+        self.min_changed = min_changed
+        self.size = size
+        self._prev = None
+
+    def __call__(self, frame):
+        gray = cv2.GaussianBlur(cv2.cvtColor(cv2.resize(frame, self.size), cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        prev, self._prev = self._prev, gray
+        if prev is None:
+            return True
+        changed = (cv2.absdiff(gray, prev) > self.threshold).mean()
+        return changed >= self.min_changed
+
+
+def box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+class Track:
+    """One plate followed across frames, with the readings collected for it."""
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.missed = 0
+        self.consensus = PlateConsensus()
+        self.committed = False
+        self.best_crop = None
+        self._best_confidence = -1.0
+
+    def add_reading(self, plate_text, confidences, crop=None):
+        if plate_text:
+            self.consensus.add(plate_text, confidences)
+            # Keep the sharpest crop of the vehicle for the session record
+            confidence = min(confidences) if confidences else 0.0
+            if crop is not None and confidence > self._best_confidence:
+                self.best_crop, self._best_confidence = crop, confidence
+
+
+class PlateTracker:
+    """Greedy IoU tracker for plate boxes of a single camera."""
+
+    def __init__(self, iou_threshold=0.3, max_missed=5):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks = []
+        self._next_id = 1
+
+    def update(self, detections):
+        """Match (box, plate_text, confidences, crop) detections to tracks. Returns the tracks that expired."""
+        unmatched = list(range(len(self.tracks)))
+        for box, plate_text, confidences, crop in detections:
+            best, best_iou = None, self.iou_threshold
+            for i in unmatched:
+                overlap = box_iou(self.tracks[i].box, box)
+                if overlap >= best_iou:
+                    best, best_iou = i, overlap
+            if best is None:
+                track = Track(self._next_id, box)
+                self._next_id += 1
+                self.tracks.append(track)
+            else:
+                unmatched.remove(best)
+                track = self.tracks[best]
+                track.box = box
+                track.missed = 0
+            track.add_reading(plate_text, confidences, crop)
+
+        for i in unmatched:
+            self.tracks[i].missed += 1
+        expired = [t for t in self.tracks if t.missed > self.max_missed]
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        return expired
+
+
+class CameraWorker(threading.Thread):
+    """Reads a video file or RTSP stream and makes one gate decision per tracked vehicle."""
+
+    def __init__(self, camera_id, source, mode, infer, on_plate,
+                 min_interval=1, max_interval=15, min_readings=2, min_confidence=0.75, reconnect_delay=5.0):
+        super().__init__(name=f"camera-{camera_id}", daemon=True)
+        self.camera_id = camera_id
+        self.source = source
+        self.mode = mode
+        # infer: (frame, camera_id) -> list of (box, crop, plate_text, confidences)
+        # on_plate: (plate, mode, crop, camera_id) -> (success, message)
+        self.infer = infer
+        self.on_plate = on_plate
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.min_readings = min_readings
+        self.min_confidence = min_confidence
+        self.reconnect_delay = reconnect_delay
+
+        self.motion = MotionDetector()
+        self.tracker = PlateTracker()
+        self.interval = min_interval
+        self._stop_event = threading.Event()
+
+        self.frames_read = 0
+        self.frames_sampled = 0
+        self.frames_with_motion = 0
+        self.decisions = 0
+        self.unconfirmed = 0
+        self.recent = deque(maxlen=50)
+        self.error = None
+        self.errors = 0
+
+    @property
+    def is_live(self):
+        return "://" in str(self.source)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            cap = cv2.VideoCapture(self.source)
+            if cap.isOpened():
+                self._consume(cap)
+            else:
+                self.error = f"Cannot open {self.source}"
+            cap.release()
+            # Video files end, live streams get reconnected
+            if not self.is_live:
+                break
+            self._stop_event.wait(self.reconnect_delay)
+        try:
+            self._flush()
+        except Exception as e:
+            self._record_error(e)
+
+    def _consume(self, cap):
+        index = 0
+        while not self._stop_event.is_set():
+            # grab() skips decoding of frames that are not sampled
+            if not cap.grab():
+                return
+            self.frames_read += 1
+            index += 1
+            if index % self.interval:
+                continue
+            ok, frame = cap.retrieve()
+            if not ok:
+                continue
+            self.frames_sampled += 1
+            try:
+                self._process(frame)
+            except Exception as e:
+                # Models still loading, scheduler stopped, DB error: skip the frame, keep the camera running
+                self._record_error(e)
+
+    def _record_error(self, error):
+        self.errors += 1
+        self.error = f"{type(error).__name__}: {error}"
+        print(f"Camera {self.camera_id}: {self.error}")
+        self.recent.append({"time": time.time(), "error": self.error})
+
+    def _process(self, frame):
+        if not self.motion(frame):
+            self.interval = min(self.interval * 2, self.max_interval)
+            expired = self.tracker.update([])
+        else:
+            self.frames_with_motion += 1
+            self.interval = self.min_interval
+            plates = self.infer(frame, self.camera_id)
+            expired = self.tracker.update([(box, text, conf, crop) for box, crop, text, conf in plates])
+            for track in self.tracker.tracks:
+                self._maybe_commit(track)
+
+        for track in expired:
+            self._finish(track)
+
+    def _flush(self):
+        for track in self.tracker.tracks:
+            self._finish(track)
+        self.tracker.tracks = []
+
+    def _maybe_commit(self, track):
+        plate, confidence = track.consensus.result()
+        if not track.committed and len(track.consensus) >= self.min_readings and confidence >= self.min_confidence:
+            self._commit(track, plate, confidence)
+
+    def _finish(self, track):
+        """Last chance for a track that left the frame; unconfirmed plates never reach the gate."""
+        self._maybe_commit(track)
+        if not track.committed and len(track.consensus):
+            plate, confidence = track.consensus.result()
+            self.unconfirmed += 1
+            self.recent.append({
+                "time": time.time(), "track": track.id, "plate": plate, "confidence": confidence,
+                "readings": len(track.consensus), "barrier": False, "message": "Odczyt niepotwierdzony",
+            })
+
+    def _commit(self, track, plate, confidence):
+        track.committed = True
+        try:
+            success, message = self.on_plate(plate, self.mode, track.best_crop, self.camera_id)
+        except Exception:
+            # No decision was made; the track retries with its next reading
+            track.committed = False
+            raise
+        self.decisions += 1
+        self.recent.append({
+            "time": time.time(), "track": track.id, "plate": plate, "confidence": confidence,
+            "readings": len(track.consensus), "barrier": success, "message": message,
+        })
+
+    def stats(self):
+        return {
+            "camera_id": self.camera_id,
+            "source": self.source,
+            "mode": self.mode,
+            "running": self.is_alive(),
+            "error": self.error,
+            "errors": self.errors,
+            "frames_read": self.frames_read,
+            "frames_sampled": self.frames_sampled,
+            "frames_with_motion": self.frames_with_motion,
+            "sample_interval": self.interval,
+            "active_tracks": len(self.tracker.tracks),
+            "decisions": self.decisions,
+            "unconfirmed": self.unconfirmed,
+            "recent": list(self.recent),
+        }
+
+
+class StreamManager:
+    """Starts, stops and reports the per-camera workers."""
+
+    def __init__(self, infer, on_plate, stop_timeout=10.0):
+        self.infer = infer
+        self.on_plate = on_plate
+        self.stop_timeout = stop_timeout
+        self.workers = {}
+
+    def start(self, camera_id, source, mode="entry", **options):
+        if camera_id in self.workers and self.workers[camera_id].is_alive():
+            raise ValueError(f"Camera {camera_id} is already streaming")
+        worker = CameraWorker(camera_id, source, mode, self.infer, self.on_plate, **options)
+        self.workers[camera_id] = worker
+        worker.start()
+        return worker
+
+    def stop(self, camera_id):
+        worker = self.workers.get(camera_id)
+        if worker is None:
+            return False
+        worker.stop()
+        self._join(camera_id, worker, self.stop_timeout)
+        return True
+
+    def stop_all(self):
+        workers = list(self.workers.items())
+        for _, worker in workers:
+            worker.stop()
+        deadline = time.monotonic() + self.stop_timeout
+        for camera_id, worker in workers:
+            self._join(camera_id, worker, max(0.0, deadline - time.monotonic()))
+
+    def _join(self, camera_id, worker, timeout):
+        worker.join(timeout)
+        if worker.is_alive():
+            print(f"Camera {camera_id}: worker did not stop within {self.stop_timeout:.0f} s")
+        elif self.workers.get(camera_id) is worker:
+            del self.workers[camera_id]
+
+    def stats(self):
+        return [worker.stats() for worker in self.workers.values()]
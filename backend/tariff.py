@@ -0,0 +1,83 @@
+import datetime
+import os
+
+import numpy as np
+
+
+class Tariff:
+    """Parking tariff (day/night rates, minimum, daily cap, grace period) for many sessions at once."""
+
+    def __init__(self, hourly_rate=2.0, min_hours=1, daily_cap=None,
+                 night_rate=None, night_start=22, night_end=6, grace_minutes=0):
+        self.hourly_rate = hourly_rate
+        self.min_hours = min_hours
+        self.daily_cap = daily_cap
+        self.night_rate = night_rate
+        self.night_start = night_start
+        self.night_end = night_end
+        self.grace_minutes = grace_minutes
+
+        # Rate of an hour slot by the hour of day it starts in
+        self.rates = np.full(24, float(hourly_rate))
+        if night_rate is not None:
+            hours = np.arange(24)
+            if night_start > night_end:
+                night = (hours >= night_start) | (hours < night_end)
+            else:
+                night = (hours >= night_start) & (hours < night_end)
+            self.rates[night] = night_rate
+        # Prefix sums over two days: cost of < 24 slots from any start hour is one subtraction
+        self._prefix = np.concatenate([[0.0], np.cumsum(np.tile(self.rates, 2))])
+        self._day_cost = self.rates.sum()
+
+    @classmethod
+    def from_env(cls):
+        def opt_float(name):
+            value = os.environ.get(name)
+            return float(value) if value else None
+
+        return cls(
+            hourly_rate=float(os.environ.get("TARIFF_HOURLY_RATE", 2.0)),
+            min_hours=int(os.environ.get("TARIFF_MIN_HOURS", 1)),
+            daily_cap=opt_float("TARIFF_DAILY_CAP"),
+            night_rate=opt_float("TARIFF_NIGHT_RATE"),
+            night_start=int(os.environ.get("TARIFF_NIGHT_START", 22)),
+            night_end=int(os.environ.get("TARIFF_NIGHT_END", 6)),
+            grace_minutes=float(os.environ.get("TARIFF_GRACE_MINUTES", 0)),
+        )
+
+    def fees(self, entry_times, now=None):
+        """Fees for a sequence of entry times, computed in one vectorized pass."""
+        now = np.datetime64(now or datetime.datetime.now(), 'us')
+        entries = np.asarray(entry_times, dtype='datetime64[us]')
+
+        seconds = (now - entries) / np.timedelta64(1, 's')
+        slots = np.maximum(np.ceil(seconds / 3600), self.min_hours).astype(np.int64)
+        full_days, rest = np.divmod(slots, 24)
+
+        # Every full day contains each hour of day exactly once
+        start_hour = ((entries - entries.astype('datetime64[D]')) // np.timedelta64(1, 'h')).astype(np.int64)
+        rest_cost = self._prefix[start_hour + rest] - self._prefix[start_hour]
+        day_cost = self._day_cost
+        if self.daily_cap is not None:
+            day_cost = min(day_cost, self.daily_cap)
+            rest_cost = np.minimum(rest_cost, self.daily_cap)
+
+        fees = full_days * day_cost + rest_cost
+        if self.grace_minutes:
+            fees[seconds <= self.grace_minutes * 60] = 0.0
+        return np.round(fees, 2)
+
+    def fee(self, entry_time, now=None):
+        return float(self.fees([entry_time], now)[0])
+
+    def describe(self):
+        return {
+            "hourly_rate": self.hourly_rate,
+            "min_hours": self.min_hours,
+            "daily_cap": self.daily_cap,
+            "night_rate": self.night_rate,
+            "night_start": self.night_start,
+            "night_end": self.night_end,
+            "grace_minutes": self.grace_minutes,
+        }
@@ -0,0 +1,87 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass
+class Zone:
+    name: str
+    capacity: int
+    occupied: int = 0
+
+    @property
+    def free(self):
+        return self.capacity - self.occupied
+
+
+class CapacityEngine:
+    """Per-zone occupancy with atomic reserve / release, and the gate -> zone map. Event loop only."""
+
+    def __init__(self, zones, gates=None, default_zone=None):
+        if not zones:
+            raise ValueError("At least one zone is required")
+        self.zones = {name: Zone(name, int(capacity)) for name, capacity in zones.items()}
+        self.gates = dict(gates or {})
+        for gate, zone in self.gates.items():
+            if zone not in self.zones:
+                raise ValueError(f"Gate {gate} points to unknown zone {zone}")
+        self.default_zone = default_zone or next(iter(self.zones))
+        if self.default_zone not in self.zones:
+            raise ValueError(f"Default zone {self.default_zone} is not a configured zone")
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, default_capacity=20):
+        """Zones from PARKING_ZONES ("A:20,B:50"), gates from PARKING_GATES ("entry-north:A,entry-south:B")."""
+        zones = _parse_pairs(os.environ.get("PARKING_ZONES", f"A:{default_capacity}"))
+        gates = _parse_pairs(os.environ.get("PARKING_GATES", ""))
+        return cls(zones, gates, os.environ.get("PARKING_DEFAULT_ZONE") or None)
+
+    def resolve(self, zone=None, gate=None):
+        """Zone of an explicit `zone`, else of a configured `gate`, else the default zone."""
+        if zone is not None:
+            if zone not in self.zones:
+                raise KeyError(zone)
+            return zone
+        return self.gates.get(gate, self.default_zone)
+
+    def reserve(self, zone):
+        """Take one spot in `zone`. Returns False if the zone is full."""
+        state = self.zones[zone]
+        if state.occupied >= state.capacity:
+            self.rejected += 1
+            return False
+        state.occupied += 1
+        return True
+
+    def release(self, zone):
+        state = self.zones.get(zone)
+        if state is None:
+            return  # session from a zone that has since been removed from the configuration
+        if state.occupied <= 0:
+            raise RuntimeError(f"Release of an empty zone {zone}")
+        state.occupied -= 1
+
+    def reset(self, occupied):
+        """Set occupancy from a zone -> count map (start-up / reconcile). Zones not in the map are empty."""
+        for name, state in self.zones.items():
+            state.occupied = occupied.get(name, 0)
+
+    @property
+    def capacity(self):
+        return sum(state.capacity for state in self.zones.values())
+
+    @property
+    def occupied(self):
+        return sum(state.occupied for state in self.zones.values())
+
+    def snapshot(self):
+        return {name: {"capacity": state.capacity, "occupied": state.occupied, "free": state.free}
+                for name, state in self.zones.items()}
+
+
+def _parse_pairs(value):
+    pairs = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        key, _, val = item.partition(":")
+        pairs[key.strip()] = val.strip()
+    return pairs
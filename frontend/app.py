@@ -3,13 +3,42 @@ import requests
 import pandas as pd
 from PIL import Image
 import io
-import base64
+
+from event_feed import EventFeed
 
 st.set_page_config(page_title="Parking Intelligence System", layout="wide")
 BACKEND_URL = "http://backend:8000"
 
 st.title("🛡️ Inteligentny System Parkingowy")
 
+# Co ile sekund zakładki z aktywnymi sesjami przerysowują się z lokalnego stanu (bez zapytań do backendu)
+LIVE_REFRESH_S = 2
+
+@st.cache_resource
+def get_event_feed():
+    # Aktywne sesje i zajętość aktualizowane przyrostowo ze strumienia zdarzeń backendu (/events)
+    return EventFeed(BACKEND_URL)
+
+feed = get_event_feed()
+
+@st.fragment(run_every=LIVE_REFRESH_S)
+def live_status():
+    col_state, col_occupied, col_free = st.columns([2, 1, 1])
+    with col_state:
+        if feed.connected:
+            st.caption(f"🟢 Na żywo - ostatnie zdarzenie: {feed.updated_at.strftime('%H:%M:%S') if feed.updated_at else '-'}")
+        else:
+            st.caption("🔴 Brak połączenia ze strumieniem zdarzeń - ponawianie...")
+    with col_occupied:
+        st.metric("Zajęte miejsca", f"{feed.occupied}/{feed.capacity or '-'}")
+    with col_free:
+        st.metric("Wolne miejsca", feed.free if feed.free is not None else "-")
+    if len(feed.zones) > 1:
+        st.caption(" | ".join(f"Strefa {name}: {zone['free']}/{zone['capacity']} wolnych"
+                              for name, zone in feed.zones.items()))
+
+live_status()
+
 # Zakładki dla lepszej organizacji
 tab_camera, tab_active, tab_database, tab_super = st.tabs([
     "📸 Kamera i Rozpoznawanie", 
@@ -55,11 +84,12 @@ with tab_camera:
                         st.success(f"Tekst tablicy: **{plate_text}**")
                         st.info(f"Komunikat systemu: {message}")
                         
-                        # Wyświetlanie wycinka tablicy z bazy64
-                        if "image" in first_det:
+                        # Wycinek tablicy pobierany z magazynu wycinków dopiero przy wyświetlaniu
+                        if first_det.get("image_url"):
                             try:
-                                img_data = base64.b64decode(first_det["image"])
-                                st.image(img_data, caption="Wycinek rozpoznany przez LPRNet", width=300)
+                                img_res = requests.get(f"{BACKEND_URL}{first_det['image_url']}")
+                                img_res.raise_for_status()
+                                st.image(img_res.content, caption="Wycinek rozpoznany przez LPRNet", width=300)
                             except Exception as e:
                                 st.error(f"Błąd wyświetlania wycinka: {e}")
                     else:
@@ -69,115 +99,130 @@ with tab_camera:
 
 # --- ZAKŁADKA 2: OBECNIE NA PARKINGU ---
 # --- ZAKŁADKA 2: OBECNIE NA PARKINGU ---
-with tab_active:
-    st.subheader("Pojazdy znajdujące się wewnątrz obiektu")
-    
-    if st.button("🔄 Odśwież stan", key="refresh_active"):
-        st.rerun()
-
-    logs = requests.get(f"{BACKEND_URL}/logs").json()
-    df = pd.DataFrame(logs)
-    if not df.empty:
-        # Filtrujemy tylko te, które nie mają czasu wyjazdu
-        active_cars = df[df['exit_time'].isnull()].copy()
+@st.fragment(run_every=LIVE_REFRESH_S)
+def render_active():
+    active_cars = pd.DataFrame(feed.active_sessions())
+    if not active_cars.empty:
+        active_cars['entry_time'] = pd.to_datetime(active_cars['entry_time'])
+
+        # Wyświetlanie jako interaktywna tabela z przyciskami
+        st.write("Lista pojazdów (Kliknij 'Opłać' aby uregulować należność):")
         
-        if not active_cars.empty:
-            # Obliczanie opłaty dla wyświetlania
-            import datetime
-            active_cars['entry_time'] = pd.to_datetime(active_cars['entry_time'])
-            now = pd.Timestamp.now()
-            
-            # Funkcja pomocnicza do obliczania opłaty w DataFrame
-            def calc_fee(entry_t):
-                duration = now - entry_t
-                hours = duration.total_seconds() / 3600
-                import math
-                billable = math.ceil(hours)
-                if billable < 1: billable = 1
-                return billable * 2.0
-
-            active_cars['current_fee'] = active_cars['entry_time'].apply(calc_fee)
-
-            # Wyświetlanie jako interaktywna tabela z przyciskami
-            st.write("Lista pojazdów (Kliknij 'Opłać' aby uregulować należność):")
-            
-            for index, row in active_cars.iterrows():
-                col1, col2, col3, col4 = st.columns([2, 3, 2, 2])
-                with col1:
-                    st.write(f"🚗 **{row['plate']}**")
-                with col2:
-                    st.write(f"Wjazd: {row['entry_time'].strftime('%H:%M:%S')}")
-                with col3:
-                    if row['is_paid']:
-                        st.success("Opłacono")
-                    else:
-                        st.warning(f"Do zapłaty: {row['current_fee']} PLN")
-                with col4:
-                    if not row['is_paid']:
-                        if st.button(f"💸 Opłać", key=f"pay_{row['id']}"):
-                            try:
-                                pay_res = requests.post(f"{BACKEND_URL}/pay", json={"plate": row['plate']})
-                                if pay_res.status_code == 200:
-                                    st.success(f"Opłacono! Kwota: {pay_res.json()['amount']} PLN")
-                                    st.rerun()
-                                else:
-                                    st.error("Błąd płatności")
-                            except Exception as e:
-                                st.error(f"Err: {e}")
+        for index, row in active_cars.iterrows():
+            col1, col2, col3, col4 = st.columns([2, 3, 2, 2])
+            with col1:
+                st.write(f"🚗 **{row['plate']}**")
+            with col2:
+                st.write(f"Wjazd: {row['entry_time'].strftime('%H:%M:%S')}")
+            with col3:
+                if row['is_paid']:
+                    st.success("Opłacono")
+                else:
+                    st.warning(f"Do zapłaty: {row['current_fee']} PLN")
+            with col4:
+                if not row['is_paid']:
+                    if st.button(f"💸 Opłać", key=f"pay_{row['id']}"):
+                        try:
+                            pay_res = requests.post(f"{BACKEND_URL}/pay", json={"plate": row['plate']})
+                            if pay_res.status_code == 200:
+                                # Zmiana dotrze strumieniem zdarzeń przy następnym odświeżeniu
+                                st.success(f"Opłacono! Kwota: {pay_res.json()['amount']} PLN")
+                            else:
+                                st.error("Błąd płatności")
+                        except Exception as e:
+                            st.error(f"Err: {e}")
 
-        else:
-            st.info("Parking jest pusty.")
+    else:
+        st.info("Parking jest pusty.")
+
+with tab_active:
+    st.subheader("Pojazdy znajdujące się wewnątrz obiektu")
+    # Lista aktualizuje się sama (zdarzenia wjazdu, płatności, wyjazdu)
+    render_active()
 
 # --- ZAKŁADKA 3: CAŁA BAZA DANYCH ---
 with tab_database:
     st.subheader("Logi systemowe (Pełna historia)")
-    if st.button("📂 Pobierz całą bazę"):
-        logs = requests.get(f"{BACKEND_URL}/logs").json()
-        df = pd.DataFrame(logs)
+
+    # Filtry wykonywane po stronie serwera, dane pobierane stronami; /history obejmuje też sesje
+    # przeniesione do archiwum (starsze niż ARCHIVE_AFTER_DAYS), /logs tylko bieżącą tabelę
+    col_plate, col_unpaid, col_size = st.columns([3, 2, 2])
+    with col_plate:
+        plate_prefix = st.text_input("Tablica zaczyna się od:", key="db_plate_prefix")
+    with col_unpaid:
+        only_unpaid = st.checkbox("Tylko nieopłacone", key="db_unpaid")
+    with col_size:
+        page_size = st.selectbox("Wierszy na stronę", [50, 100, 500], key="db_page_size")
+
+    # Stos kursorów poprzednich stron (None = pierwsza strona)
+    if "db_cursors" not in st.session_state:
+        st.session_state.db_cursors = [None]
+
+    if st.button("📂 Pobierz stronę bazy"):
+        st.session_state.db_cursors = [None]
+        st.session_state.db_loaded = True
+
+    if st.session_state.get("db_loaded"):
+        params = {"limit": page_size}
+        if plate_prefix:
+            params["plate_prefix"] = plate_prefix.upper()
+        if only_unpaid:
+            params["unpaid"] = "true"
+        if st.session_state.db_cursors[-1]:
+            params["cursor"] = st.session_state.db_cursors[-1]
+        page = requests.get(f"{BACKEND_URL}/history", params=params).json()
+
+        df = pd.DataFrame(page["items"])
         if not df.empty:
             st.dataframe(df, use_container_width=True) # Interaktywna tabela
         else:
-            st.warning("Baza danych jest pusta.")
+            st.warning("Brak wyników.")
+
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if len(st.session_state.db_cursors) > 1 and st.button("⬅️ Poprzednia"):
+                st.session_state.db_cursors.pop()
+                st.rerun()
+        with col_page:
+            st.write(f"Strona {len(st.session_state.db_cursors)}")
+        with col_next:
+            if page["next_cursor"] and st.button("Następna ➡️"):
+                st.session_state.db_cursors.append(page["next_cursor"])
+                st.rerun()
 
 # --- ZAKŁADKA 4: SUPER PARKING (ADMIN) ---
-with tab_super:
-    st.subheader("🦸 Panel Administratora - Zarządzanie Pojazdami")
-    st.info("W tym panelu możesz wymusić wyjazd pojazdu (otwarcie bramki i usunięcie z listy aktywnych).")
+@st.fragment(run_every=LIVE_REFRESH_S)
+def render_super():
+    active_cars = pd.DataFrame(feed.active_sessions())
     
-    if st.button("🔄 Odśwież listę", key="refresh_super"):
-        st.rerun()
-
-    logs = requests.get(f"{BACKEND_URL}/logs").json()
-    df = pd.DataFrame(logs)
-    if not df.empty:
-        active_cars = df[df['exit_time'].isnull()].copy()
+    if not active_cars.empty:
+        st.write("### Aktywne sesje:")
         
-        if not active_cars.empty:
-            st.write("### Aktywne sesje:")
-            
-            for index, row in active_cars.iterrows():
-                col1, col2, col3, col4 = st.columns([2, 3, 2, 2])
-                with col1:
-                    st.write(f"🚗 **{row['plate']}**")
-                with col2:
-                    st.write(f"Wjazd: {row['entry_time']}")
-                with col3:
-                    if row['is_paid']:
-                        st.success(f"Opłacono: {row['amount_due']} PLN")
-                    else:
-                        st.error(f"Nieopłacony")
-                with col4:
-                    if st.button(f"🚨 WYPUŚĆ", key=f"force_{row['id']}"):
-                        try:
-                            res = requests.post(f"{BACKEND_URL}/force_exit", json={"plate": row['plate']})
-                            if res.status_code == 200:
-                                st.success(f"{res.json()['message']}")
-                                st.rerun()
-                            else:
-                                st.error("Błąd admina")
-                        except Exception as e:
-                            st.error(f"Err: {e}")
-        else:
-            st.success("Brak pojazdów na parkingu.")
+        for index, row in active_cars.iterrows():
+            col1, col2, col3, col4 = st.columns([2, 3, 2, 2])
+            with col1:
+                st.write(f"🚗 **{row['plate']}**")
+            with col2:
+                st.write(f"Wjazd: {row['entry_time']}")
+            with col3:
+                if row['is_paid']:
+                    st.success(f"Opłacono: {row['amount_due']} PLN")
+                else:
+                    st.error(f"Nieopłacony")
+            with col4:
+                if st.button(f"🚨 WYPUŚĆ", key=f"force_{row['id']}"):
+                    try:
+                        res = requests.post(f"{BACKEND_URL}/force_exit", json={"plate": row['plate']})
+                        if res.status_code == 200:
+                            st.success(f"{res.json()['message']}")
+                        else:
+                            st.error(res.json().get("detail", "Błąd admina"))
+                    except Exception as e:
+                        st.error(f"Err: {e}")
     else:
-        st.warning("Baza danych jest pusta.")
\ No newline at end of file
+        st.success("Brak pojazdów na parkingu.")
+
+with tab_super:
+    st.subheader("🦸 Panel Administratora - Zarządzanie Pojazdami")
+    st.info("W tym panelu możesz wymusić wyjazd pojazdu (otwarcie bramki i usunięcie z listy aktywnych).")
+    render_super()
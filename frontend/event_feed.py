@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+
+def parse_sse(lines):
+    """Zdarzenia (słowniki z pola data) ze strumienia Server-Sent Events; zwraca też ich id."""
+    event_id, data = None, []
+    for line in lines:
+        if line is None:
+            continue
+        if line == "":
+            if data:
+                yield event_id, json.loads("\n".join(data))
+            event_id, data = None, []
+        elif line.startswith(":"):
+            continue  # komentarz / keep-alive
+        elif line.startswith("id:"):
+            event_id = line[3:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+
+class EventFeed:
+    """Stan parkingu (aktywne sesje, zajętość) aktualizowany w tle ze strumienia /events backendu."""
+
+    def __init__(self, backend_url):
+        self.url = f"{backend_url}/events"
+        self.sessions = {}  # id -> sesja
+        self.occupied = 0
+        self.free = None
+        self.capacity = None
+        self.zones = {}  # strefa -> {capacity, occupied, free}
+        self.connected = False
+        self.last_event_id = None
+        self.updated_at = None
+        self.events_received = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="event-feed", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        backoff = 1
+        while True:
+            headers = {"Last-Event-ID": self.last_event_id} if self.last_event_id else {}
+            try:
+                # Timeout odczytu dłuższy niż keep-alive backendu (15 s)
+                with requests.get(self.url, stream=True, headers=headers, timeout=(5, 60)) as res:
+                    res.raise_for_status()
+                    self.connected = True
+                    backoff = 1
+                    for event_id, event in parse_sse(res.iter_lines(decode_unicode=True)):
+                        self._apply(event)
+                        self.last_event_id = event_id
+            except Exception as e:
+                print(f"Event stream disconnected: {e}")
+            self.connected = False
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _apply(self, event):
+        data = event["data"]
+        with self._lock:
+            kind = event["type"]
+            if kind == "snapshot":
+                self.sessions = {s["id"]: s for s in data["sessions"]}
+                self.occupied, self.free, self.capacity = data["occupied"], data["free"], data["capacity"]
+                self.zones = data.get("zones", {})
+            elif kind == "entry":
+                self.sessions[data["session"]["id"]] = data["session"]
+            elif kind == "payment" and data["id"] in self.sessions:
+                self.sessions[data["id"]].update(is_paid=True, amount_due=data["amount"])
+            elif kind in ("exit", "force_exit"):
+                self.sessions.pop(data["id"], None)
+            elif kind == "occupancy":
+                self.occupied, self.free, self.capacity = data["occupied"], data["free"], data["capacity"]
+                self.zones = data.get("zones", {})
+            elif kind == "fees":
+                for session_id, fee in data["fees"].items():
+                    if int(session_id) in self.sessions:
+                        self.sessions[int(session_id)]["current_fee"] = fee
+            # "resync": backend wysyła zaraz po nim nowy snapshot
+            self.events_received += 1
+            self.updated_at = datetime.now()
+
+    def active_sessions(self):
+        """Kopia aktywnych sesji, od najnowszego wjazdu."""
+        with self._lock:
+            sessions = [dict(s) for s in self.sessions.values()]
+        return sorted(sessions, key=lambda s: s["entry_time"], reverse=True)